@@ -0,0 +1,146 @@
+"""
+Benchmark: memory of a million extracted entities, dicts vs EntityStore
+
+Builds synthetic anonymised letters, then holds their medications and
+mental status observations either the way ClinicalNLP returns them (one
+dict per medication with a copied context string, one string per
+observation) or in an EntityStore, and reports traced memory for each.
+The store's figure includes the document texts it keeps for offsets.
+
+Usage:
+    python -m backend.benchmarks.entity_memory [--entities 1000000]
+"""
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from ..entity_store import CONTEXT_WINDOW, EntityStore
+
+DRUGS = ['sertraline', 'fluoxetine', 'citalopram', 'mirtazapine', 'venlafaxine',
+         'quetiapine', 'olanzapine', 'lithium', 'lamotrigine', 'lorazepam']
+DOSES = ['10mg', '15mg', '20mg', '50mg', '100mg', '150mg', '200mg', '400mg']
+RESPONSES = [None, 'Positive', 'Negative', 'Neutral']
+MEDICATIONS_PER_LETTER = 40
+OBSERVATIONS_PER_LETTER = 10
+
+# (drug start, drug end, drug, dose start, dose, date start, date, response)
+Medication = Tuple[int, int, str, int, str, int, str, str]
+
+
+def _make_letter(rng: random.Random) -> Tuple[str, List[Medication], List[Tuple[int, int]]]:
+    """Synthetic letter text plus the entity spans ClinicalNLP would find in it"""
+    parts = []
+    medications = []
+    observations = []
+    position = 0
+
+    for _ in range(MEDICATIONS_PER_LETTER):
+        drug = rng.choice(DRUGS)
+        dose = rng.choice(DOSES)
+        start_date = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2015, 2024)}"
+        sentence = f"Started {drug} {dose} daily on {start_date} with review in clinic. "
+        drug_start = position + len("Started ")
+        dose_start = drug_start + len(drug) + 1
+        date_start = dose_start + len(dose) + len(" daily on ")
+        medications.append((drug_start, drug_start + len(drug), drug, dose_start, dose,
+                            date_start, start_date, rng.choice(RESPONSES)))
+        parts.append(sentence)
+        position += len(sentence)
+
+    for _ in range(OBSERVATIONS_PER_LETTER):
+        sentence = "Mood reported as low with poor sleep and reduced appetite. "
+        observations.append((position, position + len(sentence) - 1))
+        parts.append(sentence)
+        position += len(sentence)
+
+    return "".join(parts), medications, observations
+
+
+def _as_dicts(letters) -> Tuple[List[Dict], List[str]]:
+    """Hold entities as ClinicalNLP returns them (every string a fresh copy)"""
+    medications = []
+    observations = []
+    for text, letter_medications, letter_observations in letters:
+        lowered = text.lower()
+        for start, end, _, dose_start, dose, date_start, date, response in letter_medications:
+            medications.append({
+                'drug_name': text[start:end].title(),
+                'dosage': text[dose_start:dose_start + len(dose)],
+                'start_date': text[date_start:date_start + len(date)],
+                'end_date': None,
+                'response': response,
+                'context': text[max(0, start - CONTEXT_WINDOW):end + CONTEXT_WINDOW],
+            })
+        for start, end in letter_observations:
+            observations.append(lowered[start:end])
+    return medications, observations
+
+
+def _as_store(letters) -> EntityStore:
+    """Hold entities in an EntityStore"""
+    store = EntityStore()
+    for index, (text, letter_medications, letter_observations) in enumerate(letters):
+        store.add_document(f"doc_{index}", text)
+        for start, end, drug, _, dose, _, date, response in letter_medications:
+            store.append_medication(drug.title(), start, end, dose, date, None, response)
+        for start, end in letter_observations:
+            store.append_observation(start, end)
+    return store
+
+
+def _measure(build, letters):
+    """Traced memory (MB) retained by build(letters) and the build time"""
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    result = build(letters)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, (current - baseline) / (1024 * 1024), elapsed
+
+
+def main(entities: int):
+    rng = random.Random(0)
+    per_letter = MEDICATIONS_PER_LETTER + OBSERVATIONS_PER_LETTER
+    letter_count = max(1, entities // per_letter)
+
+    # Letters are generated outside the traced region. The dicts do not need
+    # the text afterwards but the store does, so its texts are added to its total
+    letters = [_make_letter(rng) for _ in range(letter_count)]
+    text_mb = sum(sys.getsizeof(text) for text, _, _ in letters) / (1024 * 1024)
+
+    dicts, dict_mb, dict_seconds = _measure(_as_dicts, letters)
+    entity_count = len(dicts[0]) + len(dicts[1])
+    del dicts
+
+    store, store_mb, store_seconds = _measure(_as_store, letters)
+    store_mb += text_mb
+
+    # Converting back to dicts: one letter's medications
+    started = time.perf_counter()
+    records = list(store.iter_medications(f"doc_{letter_count // 2}"))
+    convert_ms = (time.perf_counter() - started) * 1000
+
+    print(f"{entity_count:,} entities in {letter_count:,} letters")
+    print(f"{'representation':<18}{'MB':>10}{'bytes/entity':>15}{'build s':>10}")
+    print(f"{'dicts + strings':<18}{dict_mb:>10.1f}{dict_mb * 1024 * 1024 / entity_count:>15.1f}"
+          f"{dict_seconds:>10.2f}")
+    print(f"{'EntityStore':<18}{store_mb:>10.1f}{store_mb * 1024 * 1024 / entity_count:>15.1f}"
+          f"{store_seconds:>10.2f}")
+    print(f"saving: {100 * (1 - store_mb / dict_mb):.0f}% "
+          f"(store includes {text_mb:.1f} MB of retained letter text)")
+    print(f"convert {len(records)} medications of one letter to dicts: {convert_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--entities", type=int, default=1_000_000)
+    args = arg_parser.parse_args()
+    main(args.entities)
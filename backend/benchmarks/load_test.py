@@ -0,0 +1,120 @@
+"""
+Load test: health check latency while analysis jobs saturate the workers
+
+Runs the FastAPI app in-process and fires a burst of CPU-bound jobs, once
+through the execution layer's process pool and once inline in an async
+route (what a naive pipeline wiring would do), while polling `/` every
+50 ms. With the execution layer `/` latency stays flat; inline, every
+health check waits for the running job to finish.
+
+Usage:
+    python -m backend.benchmarks.load_test [--jobs 4] [--job-seconds 1.0]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+from ..config import settings
+from ..executor import endpoint_limits, executor
+from ..main import app
+
+
+def _burn_cpu(seconds: float) -> int:
+    """Stand-in for PDF parsing/OCR/spaCy: spin the CPU for `seconds`"""
+    deadline = time.perf_counter() + seconds
+    count = 0
+    while time.perf_counter() < deadline:
+        count += 1
+    return count
+
+
+@app.post("/bench/offloaded")
+async def _bench_offloaded(seconds: float):
+    async with endpoint_limits['analyze']:
+        return {"iterations": await executor.run_cpu(_burn_cpu, seconds)}
+
+
+@app.post("/bench/inline")
+async def _bench_inline(seconds: float):
+    return {"iterations": _burn_cpu(seconds)}
+
+
+async def _poll_health(client: httpx.AsyncClient, stop: asyncio.Event) -> List[float]:
+    """
+    Send a health check every 50 ms and record latency from the scheduled
+    send time, so time spent waiting for a blocked event loop is counted
+    """
+    latencies = []
+    scheduled = time.perf_counter()
+    while True:
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        response = await client.get("/")
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - scheduled) * 1000)
+        if stop.is_set():
+            break
+        scheduled = max(scheduled + 0.05, time.perf_counter())
+    return latencies
+
+
+async def _run_scenario(client: httpx.AsyncClient, route: str, jobs: int,
+                        job_seconds: float) -> Dict[str, float]:
+    stop = asyncio.Event()
+    poller = asyncio.create_task(_poll_health(client, stop))
+    await asyncio.sleep(0.2)
+
+    started = time.perf_counter()
+    if route:
+        responses = await asyncio.gather(*[
+            client.post(route, params={"seconds": job_seconds}) for _ in range(jobs)
+        ])
+        for response in responses:
+            response.raise_for_status()
+    else:
+        await asyncio.sleep(jobs * job_seconds / settings.cpu_workers)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    latencies = await poller
+    latencies.sort()
+    return {
+        'checks': len(latencies),
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0],
+        'max_ms': latencies[-1],
+        'jobs_s': elapsed,
+    }
+
+
+async def main(jobs: int, job_seconds: float):
+    # Start the worker processes before measuring so spawn cost is excluded
+    await executor.run_cpu(_burn_cpu, 0.0)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 timeout=None) as client:
+        results = {
+            'idle': await _run_scenario(client, "", jobs, job_seconds),
+            'process pool': await _run_scenario(client, "/bench/offloaded", jobs, job_seconds),
+            'inline': await _run_scenario(client, "/bench/inline", jobs, job_seconds),
+        }
+
+    executor.shutdown()
+
+    print(f"{jobs} jobs x {job_seconds:g}s CPU, {settings.cpu_workers} worker processes")
+    print(f"{'scenario':<14}{'checks':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'wall s':>9}")
+    for name, r in results.items():
+        print(f"{name:<14}{r['checks']:>8}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['max_ms']:>10.1f}{r['jobs_s']:>9.2f}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--jobs", type=int, default=settings.analysis_max_concurrent)
+    arg_parser.add_argument("--job-seconds", type=float, default=1.0)
+    args = arg_parser.parse_args()
+    asyncio.run(main(args.jobs, args.job_seconds))
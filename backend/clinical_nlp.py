@@ -1,7 +1,7 @@
 """
 Clinical NLP module for entity extraction and relationship mapping
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import re
 from datetime import datetime
 import spacy
@@ -52,11 +52,18 @@ class ClinicalNLP:
         Returns:
             List of medication records
         """
-        medications = []
-        
-        # Process text with spaCy
-        doc = self.nlp(text.lower())
+        return [medication for _, _, medication in self.iter_medication_matches(text)]
+    
+    def iter_medication_matches(self, text: str) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+        """
+        Extract medications along with the offsets of each drug name match
         
+        Args:
+            text: Clinical text to analyze
+            
+        Yields:
+            Tuples of (match start, match end, medication record)
+        """
         # Extract medications using patterns
         for pattern in self.medication_patterns:
             matches = re.finditer(pattern, text, re.IGNORECASE)
@@ -82,9 +89,7 @@ class ClinicalNLP:
                     'context': context
                 }
                 
-                medications.append(medication)
-        
-        return medications
+                yield match.start(), match.end(), medication
     
     def extract_mental_status(self, text: str) -> List[str]:
         """
@@ -96,6 +101,19 @@ class ClinicalNLP:
         Returns:
             List of mental status observations
         """
+        lowered = text.lower()
+        return [lowered[start:end] for start, end in self.iter_mental_status_spans(text)]
+    
+    def iter_mental_status_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Find mental status observation sentences as character offsets
+        
+        Args:
+            text: Clinical text to analyze
+            
+        Yields:
+            Tuples of (start, end) offsets of each observation, whitespace-trimmed
+        """
         mental_status_keywords = [
             'mood', 'affect', 'anxiety', 'depression', 'psychosis',
             'hallucinations', 'delusions', 'suicidal', 'manic',
@@ -103,15 +121,14 @@ class ClinicalNLP:
             'deteriorated', 'sleep', 'appetite', 'concentration'
         ]
         
-        observations = []
         doc = self.nlp(text.lower())
         
         for sent in doc.sents:
             sent_text = sent.text
             if any(keyword in sent_text for keyword in mental_status_keywords):
-                observations.append(sent_text.strip())
-        
-        return observations
+                leading = len(sent_text) - len(sent_text.lstrip())
+                trailing = len(sent_text) - len(sent_text.rstrip())
+                yield sent.start_char + leading, sent.end_char - trailing
     
     def detect_missing_data(self, medication_records: List[Dict[str, Any]]) -> List[str]:
         """
@@ -153,13 +170,15 @@ class ClinicalNLP:
                 dates.append(match.group(0))
         return dates
     
-    def assess_medication_response(self, text: str, medication: str) -> Optional[str]:
+    def assess_medication_response(self, text: str, medication: str,
+                                   start: int = 0) -> Optional[str]:
         """
         Assess patient response to medication
         
         Args:
             text: Clinical text
             medication: Medication name
+            start: Offset of the mention to assess (defaults to the first mention)
             
         Returns:
             Response assessment (Positive, Negative, Neutral, or None)
@@ -176,7 +195,7 @@ class ClinicalNLP:
         
         # Find context around medication
         med_pattern = re.compile(rf'\b{re.escape(medication)}\b', re.IGNORECASE)
-        match = med_pattern.search(text)
+        match = med_pattern.search(text, start)
         
         if not match:
             return None
@@ -20,7 +20,22 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str = "sqlite:///./psychiatrist_ai.db"
-    
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800
+    db_echo: bool = False
+    medications_page_size: int = 50
+
+    # Execution (CPU-bound work goes to processes, blocking I/O to threads)
+    cpu_workers: int = 2
+    io_workers: int = 8
+    analysis_max_concurrent: int = 4
+    upload_max_concurrent: int = 16
+    queue_timeout_seconds: float = 5.0
+    analysis_timeout_seconds: float = 300.0
+    io_timeout_seconds: float = 30.0
+
     # Security
     secret_key: str = "change-this-in-production"
     encryption_key: str = "change-this-in-production"
@@ -0,0 +1,499 @@
+"""
+Persistence layer: pooled engine, sessions, bulk inserts and paginated queries
+"""
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from dateutil import parser as date_parser
+from sqlalchemy import create_engine, delete, event, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from .config import settings
+from .models import (
+    AuditEventRow,
+    Base,
+    DocumentParagraphRow,
+    DocumentRow,
+    MedicationEpisodeRow,
+    MentalStatusObservationRow,
+)
+
+
+def create_db_engine(database_url: Optional[str] = None) -> Engine:
+    """
+    Create a pooled SQLAlchemy engine for SQLite or Postgres
+
+    SQLite connections are switched to WAL mode so readers do not block the
+    writer during bulk inserts; Postgres uses a sized QueuePool with
+    pre-ping so stale connections are recycled transparently.
+
+    Args:
+        database_url: Database URL (defaults to settings.database_url)
+
+    Returns:
+        Configured engine
+    """
+    url = database_url or settings.database_url
+
+    if url.startswith("sqlite"):
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # In-memory databases live in a single shared connection
+            engine = create_engine(
+                url,
+                echo=settings.db_echo,
+                connect_args={"check_same_thread": False},
+                poolclass=StaticPool,
+            )
+            event.listen(engine, "connect", _configure_sqlite_connection)
+            return engine
+
+        engine = create_engine(
+            url,
+            echo=settings.db_echo,
+            connect_args={"check_same_thread": False},
+            poolclass=QueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_pre_ping=True,
+        )
+        event.listen(engine, "connect", _configure_sqlite_connection)
+        return engine
+
+    return create_engine(
+        url,
+        echo=settings.db_echo,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=True,
+    )
+
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """Enable WAL journaling and foreign keys on each new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+# Global engine and session factory
+engine = create_db_engine()
+SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+
+def init_db(bind: Optional[Engine] = None):
+    """
+    Create all tables (for development and tests; production uses alembic)
+
+    Args:
+        bind: Engine to create tables on (defaults to the global engine)
+    """
+    Base.metadata.create_all(bind=bind or engine)
+
+
+def get_session() -> Iterator[Session]:
+    """FastAPI dependency yielding a session that is closed after the request"""
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def parse_clinical_date(value: Optional[str]) -> Optional[date]:
+    """
+    Parse a date string as extracted by ClinicalNLP (UK day-first order)
+
+    Args:
+        value: Raw date string, e.g. "15/01/2024" or "Jan 15, 2024"
+
+    Returns:
+        Parsed date, or None if missing or unparseable
+    """
+    if not value:
+        return None
+    try:
+        return date_parser.parse(value, dayfirst=True).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+def save_analysis_results(session: Session, results: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Persist the output of a batch analysis run using executemany statements
+
+    Each result is a dictionary with the keys 'document_id', 'filename',
+    'format', 'patient_pseudonym', 'medications' (ClinicalNLP medication
+    dicts, optionally with a 'response'), 'mental_status' (observation
+    strings) and optionally 'paragraphs' (incremental.analyse_paragraphs
+    records). Rows for all documents are collected first and written with
+    one statement per table and operation, so the cost is a handful of
+    round trips rather than one per entity.
+
+    Results with paragraphs are merged into what is stored: only paragraphs
+    marked 'modified' are rewritten, together with their medication
+    episodes and observations, paragraphs that no longer exist are deleted
+    (their entities go with them through ON DELETE CASCADE) and moved ones
+    get their new position. Entities of untouched paragraphs keep their ids,
+    so cursors from list_medications stay valid. Results without paragraphs
+    replace all of the document's entities.
+
+    Args:
+        session: Database session (flushed, not committed; the caller commits)
+        results: Batch analysis results
+
+    Returns:
+        Number of rows inserted or updated per table
+    """
+    now = datetime.now()
+    results = list(results)
+    document_ids = [result['document_id'] for result in results]
+
+    stored_pseudonyms = dict(session.execute(
+        select(DocumentRow.id, DocumentRow.patient_pseudonym).where(DocumentRow.id.in_(document_ids))
+    ).all())
+    stored_paragraphs = {
+        row.id: (row.document_id, row.position)
+        for row in session.execute(
+            select(DocumentParagraphRow.id, DocumentParagraphRow.document_id,
+                   DocumentParagraphRow.position)
+            .where(DocumentParagraphRow.document_id.in_(
+                [result['document_id'] for result in results if 'paragraphs' in result]
+            ))
+        )
+    }
+
+    new_documents = []
+    updated_documents = []
+    renamed_documents = {}
+    replaced_documents = []
+    medication_rows = []
+    observation_rows = []
+    new_paragraphs = []
+    updated_paragraphs = []
+    moved_paragraphs = []
+    rewritten_paragraph_ids = []
+    kept_paragraph_ids = set()
+
+    for result in results:
+        document_id = result['document_id']
+        pseudonym = result['patient_pseudonym']
+
+        document_row = {
+            'id': document_id,
+            'filename': result.get('filename', document_id),
+            'file_type': result.get('format', ''),
+            'upload_date': result.get('upload_date', now),
+            'patient_pseudonym': pseudonym,
+            'anonymised': result.get('anonymised', True),
+            'processed': True,
+        }
+        if document_id not in stored_pseudonyms:
+            new_documents.append(document_row)
+        else:
+            if 'upload_date' not in result:
+                # Re-analysing a document keeps the date it was uploaded
+                del document_row['upload_date']
+            updated_documents.append(document_row)
+            if stored_pseudonyms[document_id] != pseudonym:
+                renamed_documents[document_id] = pseudonym
+
+        if 'paragraphs' not in result:
+            replaced_documents.append(document_id)
+            medication_rows.extend(
+                _medication_row(document_id, pseudonym, None, med, now)
+                for med in result.get('medications', [])
+            )
+            observation_rows.extend(
+                _observation_row(document_id, pseudonym, None, observation, now)
+                for observation in result.get('mental_status', [])
+            )
+            continue
+
+        for position, paragraph in enumerate(result['paragraphs']):
+            paragraph_id = paragraph.get('id')
+            if stored_paragraphs.get(paragraph_id, (None,))[0] != document_id:
+                # New paragraph (or an id that is no longer stored)
+                new_paragraphs.append((document_id, pseudonym, position, paragraph))
+                continue
+
+            kept_paragraph_ids.add(paragraph_id)
+            if paragraph.get('modified', True):
+                updated_paragraphs.append(
+                    dict(_paragraph_row(document_id, position, paragraph), id=paragraph_id)
+                )
+                rewritten_paragraph_ids.append(paragraph_id)
+                medication_rows.extend(
+                    _medication_row(document_id, pseudonym, paragraph_id, med, now)
+                    for med in paragraph['medications']
+                )
+                observation_rows.extend(
+                    _observation_row(document_id, pseudonym, paragraph_id, observation, now)
+                    for observation in paragraph['mental_status']
+                )
+            elif stored_paragraphs[paragraph_id][1] != position:
+                moved_paragraphs.append({'id': paragraph_id, 'position': position})
+
+    deleted_paragraph_ids = [
+        paragraph_id for paragraph_id in stored_paragraphs if paragraph_id not in kept_paragraph_ids
+    ]
+
+    # A list of parameter dicts makes SQLAlchemy use cursor.executemany()
+    if new_documents:
+        session.execute(insert(DocumentRow), new_documents)
+    if updated_documents:
+        session.execute(update(DocumentRow), updated_documents)
+    for document_id, pseudonym in renamed_documents.items():
+        for table in (MedicationEpisodeRow, MentalStatusObservationRow):
+            session.execute(
+                update(table).where(table.document_id == document_id)
+                .values(patient_pseudonym=pseudonym)
+            )
+
+    if replaced_documents:
+        for table in (MedicationEpisodeRow, MentalStatusObservationRow, DocumentParagraphRow):
+            session.execute(delete(table).where(table.document_id.in_(replaced_documents)))
+    merged_documents = [result['document_id'] for result in results if 'paragraphs' in result]
+    if merged_documents:
+        # Entities saved for these documents without paragraphs
+        for table in (MedicationEpisodeRow, MentalStatusObservationRow):
+            session.execute(delete(table).where(
+                table.document_id.in_(merged_documents), table.paragraph_id.is_(None)
+            ))
+    if deleted_paragraph_ids:
+        session.execute(
+            delete(DocumentParagraphRow).where(DocumentParagraphRow.id.in_(deleted_paragraph_ids))
+        )
+    if rewritten_paragraph_ids:
+        for table in (MedicationEpisodeRow, MentalStatusObservationRow):
+            session.execute(delete(table).where(table.paragraph_id.in_(rewritten_paragraph_ids)))
+
+    if updated_paragraphs:
+        session.execute(update(DocumentParagraphRow), updated_paragraphs)
+    if moved_paragraphs:
+        session.execute(update(DocumentParagraphRow), moved_paragraphs)
+    if new_paragraphs:
+        # RETURNING in parameter order gives the ids of the inserted rows,
+        # which their entities refer to
+        paragraph_ids = session.scalars(
+            insert(DocumentParagraphRow).returning(
+                DocumentParagraphRow.id, sort_by_parameter_order=True
+            ),
+            [_paragraph_row(document_id, position, paragraph)
+             for document_id, _, position, paragraph in new_paragraphs]
+        ).all()
+        for paragraph_id, (document_id, pseudonym, _, paragraph) in zip(paragraph_ids, new_paragraphs):
+            medication_rows.extend(
+                _medication_row(document_id, pseudonym, paragraph_id, med, now)
+                for med in paragraph['medications']
+            )
+            observation_rows.extend(
+                _observation_row(document_id, pseudonym, paragraph_id, observation, now)
+                for observation in paragraph['mental_status']
+            )
+
+    if medication_rows:
+        session.execute(insert(MedicationEpisodeRow), medication_rows)
+    if observation_rows:
+        session.execute(insert(MentalStatusObservationRow), observation_rows)
+    session.flush()
+
+    return {
+        'documents': len(new_documents) + len(updated_documents),
+        'medication_episodes': len(medication_rows),
+        'mental_status_observations': len(observation_rows),
+        'document_paragraphs': len(new_paragraphs) + len(updated_paragraphs) + len(moved_paragraphs),
+    }
+
+
+def _paragraph_row(document_id: str, position: int, paragraph: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'document_id': document_id,
+        'position': position,
+        'content_hash': paragraph['content_hash'],
+        'anonymised_text': paragraph['anonymised_text'],
+        'entities_removed': paragraph['entities_removed'],
+        'entity_types': paragraph['entity_types'],
+        'medications': paragraph['medications'],
+        'mental_status': paragraph['mental_status'],
+    }
+
+
+def _medication_row(document_id: str, pseudonym: str, paragraph_id: Optional[int],
+                    med: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    return {
+        'document_id': document_id,
+        'paragraph_id': paragraph_id,
+        'patient_pseudonym': pseudonym,
+        'drug_name': med['drug_name'],
+        'dosage': med.get('dosage'),
+        'start_date': parse_clinical_date(med.get('start_date')),
+        'end_date': parse_clinical_date(med.get('end_date')),
+        'response': med.get('response'),
+        'created_at': now,
+    }
+
+
+def _observation_row(document_id: str, pseudonym: str, paragraph_id: Optional[int],
+                     observation: str, now: datetime) -> Dict[str, Any]:
+    return {
+        'document_id': document_id,
+        'paragraph_id': paragraph_id,
+        'patient_pseudonym': pseudonym,
+        'observation': observation,
+        'recorded_date': None,
+        'created_at': now,
+    }
+
+
+def save_audit_events(session: Session, entries: Iterable[Dict[str, Any]],
+                      action: str = "anonymise", user_id: Optional[str] = None) -> int:
+    """
+    Persist anonymiser audit log entries in a single executemany insert
+
+    Args:
+        session: Database session (flushed, not committed; the caller commits)
+        entries: Entries as returned by PatientAnonymiser.get_audit_log()
+        action: Action name recorded for every entry
+        user_id: Optional user responsible for the action
+
+    Returns:
+        Number of audit events inserted
+    """
+    rows = []
+    for entry in entries:
+        timestamp = entry.get('timestamp')
+        rows.append({
+            'action': action,
+            'entity_type': 'document',
+            'entity_id': entry.get('document_id'),
+            'patient_pseudonym': entry.get('patient_pseudonym'),
+            'user_id': user_id,
+            'timestamp': datetime.fromisoformat(timestamp) if timestamp else datetime.now(),
+            'details': {
+                'entities_removed': entry.get('entities_removed', 0),
+                'entity_types': entry.get('entity_types', []),
+            },
+        })
+
+    if rows:
+        session.execute(insert(AuditEventRow), rows)
+        session.flush()
+
+    return len(rows)
+
+
+def store_analysis(result: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Persist a single pipeline result and its audit entries in one transaction
+
+    Either both the analysis and its audit trail are stored or neither is.
+    Blocking; call through the execution layer's thread pool.
+
+    Args:
+        result: Result as returned by pipeline.analyse_document
+
+    Returns:
+        Number of rows inserted per table
+    """
+    with SessionLocal() as session:
+        counts = save_analysis_results(session, [result])
+        counts['audit_events'] = save_audit_events(session, result.get('audit_log', []))
+        session.commit()
+    return counts
+
+
+def load_previous_analysis(document_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the stored paragraphs of a document's last analysed version
+
+    Blocking; call through the execution layer's thread pool.
+
+    Args:
+        document_id: Document identifier
+
+    Returns:
+        Dictionary with 'patient_pseudonym' and 'paragraphs' (in the shape
+        produced by incremental.analyse_paragraphs), or None if the document
+        has not been analysed paragraph by paragraph before
+    """
+    with SessionLocal() as session:
+        document = session.get(DocumentRow, document_id)
+        if document is None:
+            return None
+
+        rows = session.scalars(
+            select(DocumentParagraphRow)
+            .where(DocumentParagraphRow.document_id == document_id)
+            .order_by(DocumentParagraphRow.position)
+        ).all()
+        if not rows:
+            return None
+
+        return {
+            'patient_pseudonym': document.patient_pseudonym,
+            'paragraphs': [
+                {
+                    'id': row.id,
+                    'content_hash': row.content_hash,
+                    'anonymised_text': row.anonymised_text,
+                    'entities_removed': row.entities_removed,
+                    'entity_types': row.entity_types,
+                    'medications': row.medications,
+                    'mental_status': row.mental_status,
+                }
+                for row in rows
+            ],
+        }
+
+
+def list_medications(session: Session, patient_pseudonym: str,
+                     cursor: Optional[int] = None, limit: Optional[int] = None,
+                     start_date: Optional[date] = None,
+                     end_date: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Return one page of a patient's medication episodes using keyset pagination
+
+    The cursor is the id of the last row on the previous page, so each page
+    is an index range scan on (patient_pseudonym, id) regardless of depth.
+
+    Args:
+        session: Database session
+        patient_pseudonym: Patient pseudonym to filter by
+        cursor: Id of the last row returned by the previous page
+        limit: Maximum rows to return (defaults to settings.medications_page_size)
+        start_date: Only include episodes starting on or after this date
+        end_date: Only include episodes starting on or before this date
+
+    Returns:
+        Dictionary with 'medications' rows and 'next_cursor' (None on the last page)
+    """
+    limit = limit or settings.medications_page_size
+
+    query = select(MedicationEpisodeRow).where(
+        MedicationEpisodeRow.patient_pseudonym == patient_pseudonym
+    )
+    if cursor is not None:
+        query = query.where(MedicationEpisodeRow.id > cursor)
+    if start_date is not None:
+        query = query.where(MedicationEpisodeRow.start_date >= start_date)
+    if end_date is not None:
+        query = query.where(MedicationEpisodeRow.start_date <= end_date)
+
+    # Fetch one extra row to know whether another page exists
+    query = query.order_by(MedicationEpisodeRow.id).limit(limit + 1)
+    rows: List[MedicationEpisodeRow] = list(session.scalars(query))
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        'medications': rows,
+        'next_cursor': rows[-1].id if has_more else None,
+    }
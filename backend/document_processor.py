@@ -2,14 +2,19 @@
 Document processing module for extracting text from various formats
 """
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Tuple
 from pathlib import Path
 import PyPDF2
 from PIL import Image
 import pytesseract
+from pdf2image import convert_from_path
 from docx import Document
 
 
+class DocumentProcessingError(Exception):
+    """Raised when a document cannot be read (corrupt or unreadable file)"""
+
+
 class DocumentProcessor:
     """Handles document ingestion and text extraction"""
     
@@ -48,18 +53,49 @@ class DocumentProcessor:
             'length': len(text)
         }
     
-    def _process_pdf(self, file_path: str) -> str:
-        """Extract text from PDF"""
-        text = ""
+    def iter_pages(self, file_path: str) -> Iterator[Tuple[int, int, str]]:
+        """
+        Extract text one page at a time so callers can report progress
+        
+        PDF pages without a text layer (scanned referrals) are OCRed
+        individually. Images and DOC/DOCX files are a single page.
+        
+        Args:
+            file_path: Path to the document file
+            
+        Yields:
+            Tuples of (page number starting at 1, total pages, page text)
+        """
+        file_extension = Path(file_path).suffix.lower().replace('.', '')
+        
+        if file_extension not in self.supported_formats:
+            raise ValueError(f"Unsupported file format: {file_extension}")
+        
+        if file_extension != 'pdf':
+            yield 1, 1, self.supported_formats[file_extension](file_path)
+            return
+        
         try:
             with open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
+                total_pages = len(pdf_reader.pages)
+                for index, page in enumerate(pdf_reader.pages):
+                    text = (page.extract_text() or "").strip()
+                    if not text:
+                        text = self._ocr_pdf_page(file_path, index + 1)
+                    yield index + 1, total_pages, text
         except Exception as e:
-            raise Exception(f"Error processing PDF: {str(e)}")
-        
-        return text.strip()
+            raise DocumentProcessingError(f"Error processing PDF: {str(e)}")
+    
+    def _ocr_pdf_page(self, file_path: str, page_number: int) -> str:
+        """Rasterise a single PDF page and extract its text using OCR"""
+        images = convert_from_path(file_path, first_page=page_number, last_page=page_number)
+        return "\n".join(pytesseract.image_to_string(image) for image in images).strip()
+    
+    def _process_pdf(self, file_path: str) -> str:
+        """Extract text from PDF, OCRing pages without a text layer"""
+        # Joined as the streaming pipeline joins pages, so both see the same text
+        return "\n".join(text for _, _, text in self.iter_pages(file_path)).strip()
     
     def _process_image(self, file_path: str) -> str:
         """Extract text from image using OCR"""
@@ -68,7 +104,7 @@ class DocumentProcessor:
             text = pytesseract.image_to_string(image)
             return text.strip()
         except Exception as e:
-            raise Exception(f"Error processing image: {str(e)}")
+            raise DocumentProcessingError(f"Error processing image: {str(e)}")
     
     def _process_doc(self, file_path: str) -> str:
         """Extract text from DOC/DOCX"""
@@ -77,4 +113,4 @@ class DocumentProcessor:
             text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
             return text.strip()
         except Exception as e:
-            raise Exception(f"Error processing DOC/DOCX: {str(e)}")
+            raise DocumentProcessingError(f"Error processing DOC/DOCX: {str(e)}")
@@ -0,0 +1,265 @@
+"""
+Compact columnar storage for entities extracted by ClinicalNLP
+"""
+from array import array
+from bisect import bisect_right
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional
+
+from dateutil import parser as date_parser
+
+# Response values are stored as small integer codes
+RESPONSES = [None, 'Positive', 'Negative', 'Neutral']
+_RESPONSE_CODES = {response: code for code, response in enumerate(RESPONSES)}
+
+# Characters of context kept either side of a medication, as in ClinicalNLP
+CONTEXT_WINDOW = 100
+
+
+class StringTable:
+    """Interns repeated strings (drug names, dosages, dates) as integer codes"""
+
+    __slots__ = ('values', '_codes')
+
+    def __init__(self):
+        # Code 0 is reserved for None
+        self.values: List[Optional[str]] = [None]
+        self._codes: Dict[str, int] = {}
+
+    def code(self, value: Optional[str]) -> int:
+        """Return the code for value, adding it on first sight"""
+        if value is None:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class EntityStore:
+    """
+    Array-backed store for medications and mental status observations
+
+    Instead of one dict per medication (with its own copy of a 200-character
+    context string) every field is a column in a typed array: drug names,
+    dosages and dates as extracted are interned codes, and positions are
+    offsets into the source text (kept once per document). Dates are also
+    kept as proleptic Gregorian ordinals (0 when missing or unparseable) for
+    date-range filtering. Context strings and observation sentences are
+    sliced from the source text only when a record is converted back to a
+    dict.
+
+    The store is a library for holding large batches in memory; the API
+    and the pipeline still pass plain dicts.
+
+    Entities are appended to the most recently added document, so each
+    document's rows form a contiguous range found from its first row.
+    """
+
+    def __init__(self):
+        # Documents
+        self.document_ids: List[str] = []
+        self.texts: List[str] = []
+        self._document_index: Dict[str, int] = {}
+
+        # First medication and observation row of each document
+        self.med_offsets = array('I')
+        self.obs_offsets = array('I')
+
+        # Medication columns
+        self.drug_names = StringTable()
+        self.dosages = StringTable()
+        self.dates = StringTable()
+        self.med_drug = array('I')
+        self.med_dosage = array('I')
+        self.med_start = array('I')
+        self.med_end = array('I')
+        self.med_start_date = array('I')
+        self.med_end_date = array('I')
+        self.med_start_ordinal = array('i')
+        self.med_end_ordinal = array('i')
+        self.med_response = array('b')
+
+        # Mental status columns (offsets into the lower-cased text)
+        self.obs_start = array('I')
+        self.obs_end = array('I')
+
+        self._date_cache: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.med_drug) + len(self.obs_start)
+
+    def add_document(self, document_id: str, text: str, nlp=None,
+                     assess_response: bool = True) -> int:
+        """
+        Register a document and, if an NLP processor is given, extract its entities
+
+        Args:
+            document_id: Document identifier
+            text: Text the entity offsets refer to (usually anonymised text)
+            nlp: Optional ClinicalNLP instance used to extract entities
+            assess_response: Whether to assess the response to each medication
+
+        Returns:
+            Index of the document within the store
+        """
+        index = len(self.document_ids)
+        self.document_ids.append(document_id)
+        self.texts.append(text)
+        self._document_index[document_id] = index
+        self.med_offsets.append(len(self.med_drug))
+        self.obs_offsets.append(len(self.obs_start))
+
+        if nlp is not None:
+            for start, end, med in nlp.iter_medication_matches(text):
+                response = None
+                if assess_response:
+                    response = nlp.assess_medication_response(text, med['drug_name'], start)
+                self.append_medication(
+                    med['drug_name'], start, end, med['dosage'],
+                    med['start_date'], med['end_date'], response
+                )
+            for start, end in nlp.iter_mental_status_spans(text):
+                self.append_observation(start, end)
+
+        return index
+
+    def append_medication(self, drug_name: str, start: int, end: int,
+                          dosage: Optional[str] = None, start_date: Optional[str] = None,
+                          end_date: Optional[str] = None, response: Optional[str] = None):
+        """
+        Append one medication of the most recently added document
+
+        Args:
+            drug_name: Normalised drug name
+            start: Offset of the drug name match in the document text
+            end: End offset of the drug name match
+            dosage: Dosage string, e.g. "50mg"
+            start_date: Start date as extracted from the text
+            end_date: End date as extracted from the text
+            response: Positive, Negative, Neutral or None
+        """
+        if not self.document_ids:
+            raise ValueError("add_document must be called before appending entities")
+
+        self.med_drug.append(self.drug_names.code(drug_name))
+        self.med_dosage.append(self.dosages.code(dosage))
+        self.med_start.append(start)
+        self.med_end.append(end)
+        self.med_start_date.append(self.dates.code(start_date))
+        self.med_end_date.append(self.dates.code(end_date))
+        self.med_start_ordinal.append(self._date_ordinal(start_date))
+        self.med_end_ordinal.append(self._date_ordinal(end_date))
+        self.med_response.append(_RESPONSE_CODES[response])
+
+    def append_observation(self, start: int, end: int):
+        """
+        Append one mental status observation of the most recently added document
+
+        Args:
+            start: Start offset of the sentence in the lower-cased text
+            end: End offset of the sentence
+        """
+        if not self.document_ids:
+            raise ValueError("add_document must be called before appending entities")
+
+        self.obs_start.append(start)
+        self.obs_end.append(end)
+
+    def medication(self, row: int, include_context: bool = False) -> Dict[str, Any]:
+        """
+        Rebuild a medication in the dict shape returned by ClinicalNLP
+
+        Dates are returned exactly as extracted, and 'response' is included
+        as in the pipeline's medication dicts.
+
+        Args:
+            row: Medication row number
+            include_context: Whether to slice the context string from the text
+
+        Returns:
+            Medication dictionary
+        """
+        medication = {
+            'drug_name': self.drug_names.values[self.med_drug[row]],
+            'dosage': self.dosages.values[self.med_dosage[row]],
+            'start_date': self.dates.values[self.med_start_date[row]],
+            'end_date': self.dates.values[self.med_end_date[row]],
+            'response': RESPONSES[self.med_response[row]],
+        }
+
+        if include_context:
+            text = self.texts[bisect_right(self.med_offsets, row) - 1]
+            start = max(0, self.med_start[row] - CONTEXT_WINDOW)
+            end = min(len(text), self.med_end[row] + CONTEXT_WINDOW)
+            medication['context'] = text[start:end]
+
+        return medication
+
+    def iter_medications(self, document_id: Optional[str] = None,
+                         include_context: bool = False,
+                         start_date: Optional[date] = None,
+                         end_date: Optional[date] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield medications as dicts, optionally for a single document
+
+        The dicts match the medications accepted by
+        database.save_analysis_results.
+
+        Args:
+            document_id: Only yield this document's medications
+            include_context: Whether to slice the context string from the text
+            start_date: Only yield medications starting on or after this date
+            end_date: Only yield medications starting on or before this date
+        """
+        if document_id is None:
+            rows = range(len(self.med_drug))
+        else:
+            rows = self._rows(self.med_offsets, len(self.med_drug), document_id)
+
+        filtered = start_date is not None or end_date is not None
+        first = start_date.toordinal() if start_date else 1
+        last = end_date.toordinal() if end_date else date.max.toordinal()
+        for row in rows:
+            # Undated medications (ordinal 0) never match a date range
+            if filtered and not first <= self.med_start_ordinal[row] <= last:
+                continue
+            yield self.medication(row, include_context)
+
+    def mental_status(self, document_id: str) -> List[str]:
+        """
+        Return a document's mental status observations as ClinicalNLP would
+
+        Args:
+            document_id: Document identifier
+
+        Returns:
+            List of lower-cased observation sentences
+        """
+        lowered = self.texts[self._document_index[document_id]].lower()
+        return [
+            lowered[self.obs_start[row]:self.obs_end[row]]
+            for row in self._rows(self.obs_offsets, len(self.obs_start), document_id)
+        ]
+
+    def _rows(self, offsets: array, total: int, document_id: str) -> range:
+        """Row range of a document within the columns indexed by offsets"""
+        document = self._document_index[document_id]
+        end = offsets[document + 1] if document + 1 < len(offsets) else total
+        return range(offsets[document], end)
+
+    def _date_ordinal(self, value: Optional[str]) -> int:
+        """Parse an extracted date (UK day-first) to an ordinal, 0 if missing"""
+        if not value:
+            return 0
+        ordinal = self._date_cache.get(value)
+        if ordinal is None:
+            try:
+                ordinal = date_parser.parse(value, dayfirst=True).date().toordinal()
+            except (ValueError, OverflowError):
+                ordinal = 0
+            self._date_cache[value] = ordinal
+        return ordinal
+
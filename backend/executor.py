@@ -0,0 +1,336 @@
+"""
+Execution layer keeping blocking work off the event loop
+
+CPU-bound work (PDF parsing, OCR, spaCy) runs in a bounded process pool and
+blocking I/O (file writes, database calls) in a thread pool. Each endpoint
+gets its own concurrency limit and every job a timeout, so a burst of
+analyses cannot stall health checks or other requests.
+
+A running worker process or thread cannot be interrupted, so a job that
+times out keeps its worker until it finishes. The request that started it
+gets a 504 straight away, but its endpoint slot is only released once the
+job actually ends; slow documents therefore make new requests wait (and
+eventually get 503) instead of piling up behind busy workers.
+
+A worker process that dies (out of memory during OCR, a crashing native
+library) breaks the whole process pool. The jobs it held fail with 503 and
+the pool is replaced, so later requests are not affected.
+"""
+import asyncio
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from .config import settings
+
+# Jobs still running after the request that started them gave up on them;
+# the EndpointLimiter entered by that request keeps its slot until they end
+_abandoned_jobs: ContextVar[Optional[List[asyncio.Future]]] = ContextVar(
+    '_abandoned_jobs', default=None
+)
+
+
+def _abandon(job: Future, future: asyncio.Future):
+    """
+    Give up on a job whose request no longer waits for it
+
+    A job still waiting for a worker is dropped. A running one cannot be
+    interrupted, so it is handed to the limiter slot of the current request,
+    which stays taken until the job finishes.
+
+    Args:
+        job: The pool's future for the job
+        future: The asyncio future wrapping it
+    """
+    if job.cancel():
+        return
+    # Retrieve the eventual exception so it is not logged as unhandled
+    future.add_done_callback(lambda done: done.cancelled() or done.exception())
+    jobs = _abandoned_jobs.get()
+    if jobs is not None:
+        jobs.append(future)
+
+
+class EndpointLimiter:
+    """
+    Caps the number of concurrent requests handled by one endpoint
+
+    Requests beyond the limit wait up to queue_timeout seconds for a slot
+    and are then rejected with 503 rather than piling up behind the pool.
+    A request whose job timed out still holds its slot until the job ends.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, queue_timeout: float):
+        """
+        Initialize limiter
+
+        Args:
+            name: Endpoint name used in error messages
+            max_concurrent: Maximum requests in flight
+            queue_timeout: Seconds to wait for a free slot before rejecting
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def __aenter__(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Too many concurrent {self.name} requests, please retry later"
+            )
+        _abandoned_jobs.set([])
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        jobs = [job for job in _abandoned_jobs.get() or [] if not job.done()]
+        _abandoned_jobs.set(None)
+        if not jobs:
+            self._semaphore.release()
+            return
+
+        remaining = len(jobs)
+
+        def job_finished(job):
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0:
+                self._semaphore.release()
+
+        for job in jobs:
+            job.add_done_callback(job_finished)
+
+
+class ExecutionLayer:
+    """Owns the process and thread pools used by the API"""
+
+    def __init__(self, cpu_workers: int = settings.cpu_workers,
+                 io_workers: int = settings.io_workers):
+        """
+        Initialize execution layer (pools are created lazily)
+
+        Args:
+            cpu_workers: Number of worker processes for CPU-bound jobs
+            io_workers: Number of threads for blocking I/O
+        """
+        self.cpu_workers = cpu_workers
+        self.io_workers = io_workers
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._manager = None
+        self._manager_lock = threading.Lock()
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            # spawn avoids forking a process that already runs threads
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.cpu_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._process_pool
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.io_workers,
+                thread_name_prefix="io"
+            )
+        return self._thread_pool
+
+    @property
+    def manager(self):
+        """
+        Multiprocessing manager providing queues and events shared with workers
+
+        Starting it spawns a process, so first access blocks; use it from
+        the thread pool rather than the event loop.
+        """
+        with self._manager_lock:
+            if self._manager is None:
+                self._manager = multiprocessing.get_context("spawn").Manager()
+            return self._manager
+
+    def _stream_channel(self):
+        """Create the queue and cancellation event for one stream (blocking)"""
+        manager = self.manager
+        return manager.Queue(), manager.Event()
+
+    async def run_cpu(self, func: Callable[..., Any], *args,
+                      timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run a CPU-bound function in the process pool
+
+        func and its arguments must be picklable (module-level functions).
+
+        Args:
+            func: Function to run
+            timeout: Seconds before the request fails with 504 (defaults
+                to settings.analysis_timeout_seconds)
+
+        Returns:
+            The function's return value
+        """
+        return await self._run(
+            self.process_pool, partial(func, *args, **kwargs),
+            timeout or settings.analysis_timeout_seconds
+        )
+
+    async def run_io(self, func: Callable[..., Any], *args,
+                     timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run a blocking I/O function in the thread pool
+
+        Args:
+            func: Function to run
+            timeout: Seconds before the request fails with 504 (defaults
+                to settings.io_timeout_seconds)
+
+        Returns:
+            The function's return value
+        """
+        return await self._run(
+            self.thread_pool, partial(func, *args, **kwargs),
+            timeout or settings.io_timeout_seconds
+        )
+
+    async def stream_cpu(self, func: Callable[..., Any], *args,
+                         timeout: Optional[float] = None, **kwargs) -> AsyncIterator[Any]:
+        """
+        Run a CPU-bound producer in the process pool and yield what it emits
+
+        func is called as func(queue, cancelled, *args, **kwargs). It must put
+        items on the queue, then None when it is done, and stop early once
+        the `cancelled` event is set. Items are yielded as soon as they
+        arrive; the producer's exception, if any, is raised at the end.
+
+        The event is set when the consumer stops reading (the client went
+        away or the stream timed out), and the request's limiter slot stays
+        taken until the producer has noticed and returned.
+
+        Args:
+            func: Producer function
+            timeout: Seconds for the whole stream (defaults to
+                settings.analysis_timeout_seconds)
+
+        Yields:
+            Items put on the queue by func
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or settings.analysis_timeout_seconds)
+        items, cancelled = await self.run_io(self._stream_channel)
+        pool = self.process_pool
+        try:
+            job = pool.submit(partial(func, items, cancelled, *args, **kwargs))
+        except BrokenProcessPool:
+            raise self._worker_crashed(pool)
+        future = asyncio.wrap_future(job)
+
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise HTTPException(
+                        status_code=504,
+                        detail="Processing did not finish within the time limit"
+                    )
+                try:
+                    # Short waits so a crashed producer is noticed promptly
+                    item = await loop.run_in_executor(
+                        self.thread_pool, partial(items.get, timeout=min(remaining, 1.0))
+                    )
+                except queue.Empty:
+                    if future.done():
+                        future.result()
+                        break
+                    continue
+                if item is None:
+                    break
+                yield item
+            await future
+        except BrokenProcessPool:
+            raise self._worker_crashed(pool)
+        finally:
+            if not future.done():
+                try:
+                    cancelled.set()
+                except (OSError, EOFError):
+                    # The manager has already shut down with the application
+                    pass
+                _abandon(job, future)
+
+    async def _run(self, pool, call: Callable[[], Any], timeout: float) -> Any:
+        try:
+            job = pool.submit(call)
+        except BrokenProcessPool:
+            raise self._worker_crashed(pool)
+        future = asyncio.wrap_future(job)
+        try:
+            # Shielded so that timing out does not mark a running job as done
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except BrokenProcessPool:
+            raise self._worker_crashed(pool)
+        except asyncio.TimeoutError:
+            _abandon(job, future)
+            raise HTTPException(
+                status_code=504,
+                detail=f"Processing did not finish within {timeout:g} seconds"
+            )
+        except asyncio.CancelledError:
+            # The request itself was cancelled, e.g. the client disconnected
+            _abandon(job, future)
+            raise
+
+    def _worker_crashed(self, pool: ProcessPoolExecutor) -> HTTPException:
+        """
+        Drop a process pool that lost a worker so the next job starts a new one
+
+        Every job in the pool fails at once, so only the first to notice
+        replaces it.
+
+        Returns:
+            The 503 error to raise for the failed job
+        """
+        if self._process_pool is pool:
+            self._process_pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+        return HTTPException(
+            status_code=503,
+            detail="A worker process stopped unexpectedly, please retry"
+        )
+
+    def shutdown(self):
+        """Stop the pools, cancelling any queued jobs"""
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+
+# Global execution layer and per-endpoint limits
+executor = ExecutionLayer()
+
+endpoint_limits: Dict[str, EndpointLimiter] = {
+    'upload': EndpointLimiter(
+        'upload', settings.upload_max_concurrent, settings.queue_timeout_seconds
+    ),
+    'analyze': EndpointLimiter(
+        'analyze', settings.analysis_max_concurrent, settings.queue_timeout_seconds
+    ),
+}
@@ -0,0 +1,369 @@
+"""
+Paragraph-level incremental analysis of revised documents
+
+A paragraph is a line of extracted text: DocumentProcessor emits one line
+per DOCX paragraph, and PDF/OCR text keeps the document's line breaks.
+Lines that an identifier runs across (an NHS number or address wrapped onto
+the next line) form a single paragraph, so each paragraph is anonymised
+together with the neighbouring lines its identifiers reach into.
+"""
+import hashlib
+import hmac
+import re
+from bisect import bisect_right
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from .config import settings
+
+PARAGRAPH_BREAK = re.compile(r'\n')
+PARAGRAPH_SEPARATOR = "\n"
+
+# Widest window any ClinicalNLP extractor reads around a match
+# (assess_medication_response looks 200 characters either side)
+CONTEXT_CHARS = 200
+
+# Identifiers PatientAnonymiser.anonymise_text redacts, with the regex flags
+# it matches them with
+REDACTED_IDENTIFIERS = {
+    'nhs_number': 0,
+    'postcode': 0,
+    'phone': 0,
+    'email': 0,
+    'address': re.IGNORECASE,
+}
+
+
+def split_paragraphs(text: str, anonymiser=None) -> List[str]:
+    """
+    Split text into non-empty, whitespace-trimmed paragraphs
+
+    Args:
+        text: Document text
+        anonymiser: PatientAnonymiser whose identifiers must not be split
+            across paragraphs; without it every line is a paragraph
+
+    Returns:
+        List of paragraphs
+    """
+    kept = _breaks_inside_identifiers(text, anonymiser) if anonymiser is not None else set()
+    paragraphs = []
+    start = 0
+    for match in PARAGRAPH_BREAK.finditer(text):
+        if match.start() in kept:
+            continue
+        paragraph = text[start:match.start()].strip()
+        if paragraph:
+            paragraphs.append(paragraph)
+        start = match.end()
+    paragraph = text[start:].strip()
+    if paragraph:
+        paragraphs.append(paragraph)
+    return paragraphs
+
+
+def _breaks_inside_identifiers(text: str, anonymiser) -> Set[int]:
+    """Offsets of the line breaks that fall inside an identifier the anonymiser redacts"""
+    offsets = set()
+    for name, flags in REDACTED_IDENTIFIERS.items():
+        for match in re.finditer(anonymiser.patterns[name], text, flags):
+            offsets.update(
+                match.start() + inner.start()
+                for inner in PARAGRAPH_BREAK.finditer(match.group(0))
+            )
+    return offsets
+
+
+def paragraph_hash(paragraph: str) -> str:
+    """
+    Keyed hash identifying an unchanged paragraph across versions
+
+    The hash is stored next to the anonymised text, so it is an HMAC keyed
+    with the application secret: a plain hash would give back a redacted
+    NHS number, postcode or phone number to anyone trying candidate values
+    against the rest of the line. Names and dates of birth are not redacted
+    by PatientAnonymiser.anonymise_text and remain in the stored text.
+    """
+    return hmac.new(settings.secret_key.encode(), paragraph.encode(), hashlib.sha256).hexdigest()
+
+
+def match_paragraphs(old_hashes: List[str], new_hashes: List[str]) -> Dict[int, int]:
+    """
+    Diff two versions of a document at paragraph level
+
+    Args:
+        old_hashes: Paragraph hashes of the previous version
+        new_hashes: Paragraph hashes of the new version
+
+    Returns:
+        Mapping of new paragraph index to the index of the identical
+        paragraph in the previous version; absent indexes have changed
+    """
+    matcher = SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    unchanged = {}
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == 'equal':
+            for offset in range(new_end - new_start):
+                unchanged[new_start + offset] = old_start + offset
+    return unchanged
+
+
+def _with_context(indexes: Set[int], lengths: List[int], chars: int) -> Set[int]:
+    """Add neighbouring paragraphs until `chars` characters surround each index"""
+    expanded = set(indexes)
+    for index in indexes:
+        covered, neighbour = 0, index - 1
+        while neighbour >= 0 and covered < chars:
+            expanded.add(neighbour)
+            covered += lengths[neighbour] + len(PARAGRAPH_SEPARATOR)
+            neighbour -= 1
+        covered, neighbour = 0, index + 1
+        while neighbour < len(lengths) and covered < chars:
+            expanded.add(neighbour)
+            covered += lengths[neighbour] + len(PARAGRAPH_SEPARATOR)
+            neighbour += 1
+    return expanded
+
+
+def _runs(indexes: Set[int]) -> List[range]:
+    """Group indexes into contiguous ranges"""
+    runs = []
+    for index in sorted(indexes):
+        if runs and runs[-1].stop == index:
+            runs[-1] = range(runs[-1].start, index + 1)
+        else:
+            runs.append(range(index, index + 1))
+    return runs
+
+
+def _offsets(lengths: List[int]) -> List[int]:
+    """Start of each paragraph in the text the paragraphs join to"""
+    offsets = []
+    position = 0
+    for length in lengths:
+        offsets.append(position)
+        position += length + len(PARAGRAPH_SEPARATOR)
+    return offsets
+
+
+def _observation_reach(records: List[Dict[str, Any]], offsets: List[int],
+                       lengths: List[int]) -> Dict[int, int]:
+    """
+    Last paragraph reached by each record's observations, where past the record
+
+    Observations are sentences, stored with the paragraph they start in. One
+    no longer found in the text (it was edited) is taken to start at the
+    end of its paragraph, which can only overestimate its reach.
+    """
+    lowered = PARAGRAPH_SEPARATOR.join(record['anonymised_text'] for record in records).lower()
+    reach = {}
+    for index, record in enumerate(records):
+        paragraph_end = offsets[index] + lengths[index]
+        end = paragraph_end
+        for observation in record.get('mental_status') or []:
+            start = lowered.find(observation, offsets[index], paragraph_end + len(observation))
+            end = max(end, (start if start >= 0 else paragraph_end) + len(observation))
+        last = min(bisect_right(offsets, end - 1) - 1, len(records) - 1)
+        if last > index:
+            reach[index] = last
+    return reach
+
+
+def context_start(records: List[Dict[str, Any]], end: Optional[int] = None) -> int:
+    """
+    Index of the first record whose entities may depend on record `end` onwards
+
+    These are the records within CONTEXT_CHARS before it, and any whose
+    observations run on to the record before it, since their sentence may
+    continue. With `end` left out this is the first record that text
+    appended to the document could change.
+    """
+    lengths = [len(record['anonymised_text']) for record in records]
+    end = len(records) if end is None else end
+    first = min(_with_context({end}, lengths[:end], CONTEXT_CHARS))
+    reach = _observation_reach(records, _offsets(lengths), lengths)
+    return min([first] + [index for index, last in reach.items() if index < first and last >= end - 1])
+
+
+def analyse_paragraphs(text: str, anonymiser, nlp, patient_id: str,
+                       previous: Optional[List[Dict[str, Any]]] = None,
+                       reextract: Iterable[int] = (), continued: bool = False) -> Dict[str, Any]:
+    """
+    Anonymise and extract entities, reusing results for unchanged paragraphs
+
+    Only paragraphs whose content changed since `previous` are anonymised;
+    identifiers never span two paragraphs, so one wrapped across lines is
+    redacted as it would be in the whole text. Entity extraction reruns on the
+    changed paragraphs plus enough neighbouring paragraphs that every
+    extractor's context window matches a full run, widened to whole
+    sentences where an observation runs over several lines; everything else
+    is taken from `previous`. Without `previous` every paragraph is new.
+
+    Each returned record keeps the stored row 'id' of the paragraph it was
+    matched to, if any, and 'modified' says whether its text or entities
+    differ from that row, so only modified paragraphs need writing back.
+
+    Args:
+        text: Extracted (not yet anonymised) document text
+        anonymiser: PatientAnonymiser instance
+        nlp: ClinicalNLP instance
+        patient_id: Identifier used to pseudonymise the patient
+        previous: Paragraph records stored for the previous version
+        reextract: Indexes into `previous` to handle as edited, such as
+            paragraphs extracted before the text following them was read
+        continued: Whether more text follows that has not been read yet;
+            `previous` then runs on past the end of `text` without that
+            being a deletion, and the caller re-extracts what the rest of
+            the text changes
+
+    Returns:
+        Dictionary with the per-paragraph records ('paragraphs'), the merged
+        'anonymised_text', 'medications' and 'mental_status', totals for the
+        paragraphs anonymised in this run, and the indexes ('reanalysed')
+        and number of paragraphs re-extracted
+    """
+    previous = previous or []
+    paragraphs = split_paragraphs(text, anonymiser)
+    hashes = [paragraph_hash(paragraph) for paragraph in paragraphs]
+    unchanged = match_paragraphs([record['content_hash'] for record in previous], hashes)
+
+    # Anonymise new and edited paragraphs only
+    records = []
+    for index, paragraph in enumerate(paragraphs):
+        if index in unchanged:
+            record = dict(previous[unchanged[index]])
+            record['modified'] = False
+            records.append(record)
+            continue
+
+        anonymised = anonymiser.anonymise_text(paragraph, patient_id)
+        # Returned to the caller in the aggregated audit entry instead
+        audit_entry = anonymiser.get_audit_log().pop()
+        records.append({
+            'content_hash': hashes[index],
+            'anonymised_text': anonymised['anonymised_text'],
+            'entities_removed': audit_entry['entities_removed'],
+            'entity_types': audit_entry['entity_types'],
+            'modified': True,
+        })
+
+    changed = {index for index in range(len(paragraphs)) if index not in unchanged}
+    lengths = [len(record['anonymised_text']) for record in records]
+
+    # Deleted paragraphs leave a gap between two unchanged neighbours, both
+    # of which may have had entities whose context reached into it
+    edited = set(changed)
+    for index, old_index in unchanged.items():
+        # The paragraph before the first one is "old index -1"
+        previous_old = unchanged.get(index - 1, -1 if index == 0 else None)
+        if previous_old is not None and old_index != previous_old + 1:
+            edited.update(neighbour for neighbour in (index - 1, index) if neighbour >= 0)
+    last = len(paragraphs) - 1
+    if not continued and last in unchanged and unchanged[last] != len(previous) - 1:
+        edited.add(last)
+
+    # Paragraphs extracted before the text after them was read count as edited
+    stale = set(reextract)
+    edited.update(index for index, old_index in unchanged.items() if old_index in stale)
+
+    # Unchanged neighbours whose context overlaps an edit are re-extracted too
+    dirty = _with_context(edited, lengths, CONTEXT_CHARS)
+
+    # Observations are sentences, which can run over many lines; each is
+    # stored with the paragraph it starts in, so an edit anywhere inside a
+    # stored sentence makes that paragraph dirty as well
+    offsets = _offsets(lengths)
+    reach = _observation_reach(records, offsets, lengths)
+    dirty.update(
+        index for index, last in reach.items()
+        if any(covered in edited for covered in range(index + 1, last + 1))
+    )
+
+    stored_entities = {}
+    extracted_until = 0
+    for run in _runs(dirty):
+        # An earlier run may have grown over this one
+        start, stop = max(run.start, extracted_until), run.stop
+        if start >= stop:
+            continue
+
+        while True:
+            for index in range(start, stop):
+                record = records[index]
+                if index not in stored_entities:
+                    stored_entities[index] = (record.get('medications'), record.get('mental_status'))
+                record['medications'] = []
+                record['mental_status'] = []
+
+            # The window also covers the whole of every stored sentence
+            # starting in the run
+            window = _with_context({start, stop - 1}, lengths, CONTEXT_CHARS)
+            window_start = min(window)
+            window_stop = max([max(window)] + [reach.get(index, index) for index in range(start, stop)]) + 1
+            window_text = PARAGRAPH_SEPARATOR.join(
+                records[index]['anonymised_text'] for index in range(window_start, window_stop)
+            )
+            base = offsets[window_start]
+
+            lowered = window_text.lower()
+            observations = []
+            for span_start, span_end in nlp.iter_mental_status_spans(window_text):
+                first = bisect_right(offsets, base + span_start) - 1
+                last = bisect_right(offsets, base + span_end - 1) - 1
+                observations.append((first, last, lowered[span_start:span_end]))
+
+            # A sentence overlapping the run that was not stored that way
+            # changes the results of every paragraph it covers, and one cut
+            # off by the window may run further: grow the run over it and
+            # read again
+            grown_start, grown_stop = start, stop
+            for first, last, observation in observations:
+                if last < start or first >= stop:
+                    continue
+                stored = stored_entities[first][1] if first in stored_entities \
+                    else records[first].get('mental_status')
+                if observation not in (stored or []):
+                    grown_start = min(grown_start, first)
+                    grown_stop = max(grown_stop, last + 1)
+            if (grown_start, grown_stop) == (start, stop):
+                break
+            start, stop = grown_start, grown_stop
+
+        # Keep only entities that start inside the run; the rest of the
+        # window is context for paragraphs whose stored results still hold
+        for first, _, observation in observations:
+            if start <= first < stop:
+                records[first]['mental_status'].append(observation)
+
+        for match_start, _, med in nlp.iter_medication_matches(window_text):
+            index = bisect_right(offsets, base + match_start) - 1
+            if start <= index < stop:
+                med['response'] = nlp.assess_medication_response(
+                    window_text, med['drug_name'], match_start
+                )
+                records[index]['medications'].append(med)
+
+        dirty.update(range(start, stop))
+        extracted_until = max(extracted_until, stop)
+
+    # Re-extracting an unchanged paragraph usually finds the same entities
+    for index, stored in stored_entities.items():
+        if stored != (records[index]['medications'], records[index]['mental_status']):
+            records[index]['modified'] = True
+
+    # Audit totals cover only what was anonymised in this run
+    entity_types = set()
+    for index in changed:
+        entity_types.update(records[index]['entity_types'])
+
+    return {
+        'paragraphs': records,
+        'anonymised_text': PARAGRAPH_SEPARATOR.join(record['anonymised_text'] for record in records),
+        'medications': [med for record in records for med in record['medications']],
+        'mental_status': [obs for record in records for obs in record['mental_status']],
+        'entities_removed': sum(records[index]['entities_removed'] for index in changed),
+        'entity_types': sorted(entity_types),
+        'paragraphs_anonymised': len(changed),
+        'reanalysed': sorted(dirty),
+        'paragraphs_reanalysed': len(dirty),
+    }
@@ -1,21 +1,58 @@
 """
 FastAPI main application for PsychiatristAI
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List, Optional
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Any, AsyncIterator, Dict, List, Optional
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime
+from contextlib import aclosing, asynccontextmanager
+from pathlib import Path
+from sqlalchemy.orm import Session
+import asyncio
+import glob
+import json
+import os
+import re
+import shutil
+import tempfile
 import uvicorn
 
 from .config import settings
+from .database import (
+    get_session,
+    init_db,
+    list_medications,
+    load_previous_analysis,
+    parse_clinical_date,
+    store_analysis,
+)
+from .document_processor import DocumentProcessingError
+from .executor import executor, endpoint_limits
+from .pipeline import analyse_document, stream_document_analysis
+
+# Document ids as generated by upload_document
+DOCUMENT_ID = re.compile(r'doc_[0-9.]+')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create missing tables in development and shut the worker pools down on exit"""
+    if settings.environment == "development":
+        # Production databases are migrated with `alembic upgrade head`
+        await executor.run_io(init_db)
+    yield
+    executor.shutdown()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="PsychiatristAI API",
     description="AI Agent for Reviewing Clinical Mental Health Documents",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -46,6 +83,14 @@ class DocumentAnalysisResult(BaseModel):
     mental_status_summary: Optional[str] = None
     anonymised: bool
     processed_at: datetime
+    paragraphs_total: Optional[int] = None
+    paragraphs_reanalysed: Optional[int] = None
+
+
+class MedicationPage(BaseModel):
+    patient_id: str
+    medications: List[MedicationRecord]
+    next_cursor: Optional[int] = None
 
 
 class HealthCheck(BaseModel):
@@ -65,35 +110,91 @@ async def root():
     )
 
 
-@app.post("/api/documents/upload")
-async def upload_document(file: UploadFile = File(...)):
-    """
-    Upload a clinical document for processing
-    Supports: PDF, JPG, JPEG, PNG, DOC, DOCX
-    """
-    # Validate file type
+def _save_upload(file_path: Path, content: bytes):
+    """Write an uploaded document to the upload directory (blocking)"""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_bytes(content)
+
+
+def _find_upload(document_id: str) -> Optional[Path]:
+    """Locate the stored file for a document id (blocking)"""
+    # Ids are generated by upload_document; anything else could be a glob
+    # pattern or path that reaches another document's file
+    if not DOCUMENT_ID.fullmatch(document_id):
+        return None
+    matches = list(Path(settings.upload_dir).glob(f"{glob.escape(document_id)}.*"))
+    return matches[0] if matches else None
+
+
+def _stage_upload(file_name: str, content: bytes) -> Path:
+    """Write a revised document next to the uploads without replacing anything (blocking)"""
+    Path(settings.upload_dir).mkdir(parents=True, exist_ok=True)
+    # A directory of its own keeps the file name (and so the analysed
+    # filename and format) while _find_upload cannot see it
+    staging = Path(tempfile.mkdtemp(prefix="revision_", dir=settings.upload_dir))
+    file_path = staging / file_name
+    _save_upload(file_path, content)
+    return file_path
+
+
+def _replace_upload(old_path: Path, staged_path: Path):
+    """Move a staged revision in place of the document's old file (blocking)"""
+    new_path = Path(settings.upload_dir) / staged_path.name
+    os.replace(staged_path, new_path)
+    if old_path != new_path:
+        old_path.unlink(missing_ok=True)
+
+
+def _discard_staged(staged_path: Path):
+    """Remove a staged revision and its directory, if still there (blocking)"""
+    shutil.rmtree(staged_path.parent, ignore_errors=True)
+
+
+def _validate_extension(file: UploadFile) -> str:
+    """Return the upload's file extension, rejecting unsupported formats"""
     file_extension = file.filename.split(".")[-1].lower()
     if file_extension not in settings.supported_formats:
         raise HTTPException(
             status_code=400,
             detail=f"Unsupported file format. Supported formats: {', '.join(settings.supported_formats)}"
         )
-    
-    # Check file size
+    return file_extension
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    """Read the upload's content, rejecting files over the size limit"""
     content = await file.read()
-    file_size_mb = len(content) / (1024 * 1024)
-    if file_size_mb > settings.max_file_size_mb:
+    if len(content) / (1024 * 1024) > settings.max_file_size_mb:
         raise HTTPException(
             status_code=400,
             detail=f"File size exceeds maximum allowed size of {settings.max_file_size_mb}MB"
         )
+    return content
+
+
+def _unreadable_document(error: Exception) -> HTTPException:
+    """422 for an upload the processor could not read (corrupt or unsupported file)"""
+    return HTTPException(
+        status_code=422,
+        detail=f"Could not read document: {error}"
+    )
+
+
+@app.post("/api/documents/upload")
+async def upload_document(file: UploadFile = File(...)):
+    """
+    Upload a clinical document for processing
+    Supports: PDF, JPG, JPEG, PNG, DOC, DOCX
+    """
+    file_extension = _validate_extension(file)
     
-    # TODO: Implement document processing pipeline
-    # 1. Save file
-    # 2. Extract text (OCR if needed)
-    # 3. Anonymise patient data
-    # 4. Extract clinical entities
-    # 5. Identify medications and mental status changes
+    async with endpoint_limits['upload']:
+        content = await _read_upload(file)
+        file_size_mb = len(content) / (1024 * 1024)
+        
+        document_id = f"doc_{datetime.now().timestamp()}"
+        file_path = Path(settings.upload_dir) / f"{document_id}.{file_extension}"
+        await executor.run_io(_save_upload, file_path, content)
     
     return JSONResponse(
         status_code=200,
@@ -101,48 +202,242 @@ async def upload_document(file: UploadFile = File(...)):
             "message": "Document uploaded successfully",
             "filename": file.filename,
             "size_mb": round(file_size_mb, 2),
-            "document_id": f"doc_{datetime.now().timestamp()}"
+            "document_id": document_id
         }
     )
 
 
 @app.post("/api/documents/analyze", response_model=DocumentAnalysisResult)
-async def analyze_document(document_id: str):
+async def analyze_document(document_id: str, patient_id: Optional[str] = None):
     """
     Analyze a clinical document and extract structured data
+    Extraction runs in the process pool; the event loop only awaits it
+    """
+    async with endpoint_limits['analyze']:
+        file_path = await executor.run_io(_find_upload, document_id)
+        if file_path is None:
+            raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+        
+        previous = await executor.run_io(load_previous_analysis, document_id)
+        try:
+            result = await executor.run_cpu(
+                analyse_document, str(file_path), document_id, patient_id, previous
+            )
+        except (DocumentProcessingError, ValueError) as e:
+            raise _unreadable_document(e)
+        await executor.run_io(store_analysis, result)
+    
+    return _to_analysis_result(document_id, result)
+
+
+@app.post("/api/documents/{document_id}/revise", response_model=DocumentAnalysisResult)
+async def revise_document(document_id: str, file: UploadFile = File(...),
+                          patient_id: Optional[str] = None):
+    """
+    Upload a revised version of a document and re-analyze it incrementally
+    Only paragraphs that changed since the last analysis (plus their
+    neighbouring context) are anonymised and analyzed again
     """
-    # TODO: Implement full analysis pipeline
-    # This is a placeholder response
+    file_extension = _validate_extension(file)
+    
+    async with endpoint_limits['analyze']:
+        old_path = await executor.run_io(_find_upload, document_id)
+        if old_path is None:
+            raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+        
+        content = await _read_upload(file)
+        # The stored version is only replaced once the revision has been
+        # analysed and stored, so a file that fails to parse loses nothing
+        staged_path = await executor.run_io(
+            _stage_upload, f"{document_id}.{file_extension}", content
+        )
+        try:
+            previous = await executor.run_io(load_previous_analysis, document_id)
+            try:
+                result = await executor.run_cpu(
+                    analyse_document, str(staged_path), document_id, patient_id, previous
+                )
+            except (DocumentProcessingError, ValueError) as e:
+                raise _unreadable_document(e)
+            await executor.run_io(store_analysis, result)
+            await executor.run_io(_replace_upload, old_path, staged_path)
+        finally:
+            await executor.run_io(_discard_staged, staged_path)
+    
+    return _to_analysis_result(document_id, result)
+
+
+async def _analysis_events(document_id: str, patient_id: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run the page-wise pipeline and yield progress events for streaming
+    
+    Emits 'page' and 'medications' events as each page is processed, then a
+    'result' event carrying the DocumentAnalysisResult once it is stored.
+    Failures are reported as a final 'error' event since the response
+    status has already been sent.
+    """
+    try:
+        async with endpoint_limits['analyze']:
+            file_path = await executor.run_io(_find_upload, document_id)
+            if file_path is None:
+                raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+            
+            previous = await executor.run_io(load_previous_analysis, document_id)
+            # aclosing stops the producer as soon as this generator is closed
+            events = executor.stream_cpu(
+                stream_document_analysis, str(file_path), document_id, patient_id, previous
+            )
+            async with aclosing(events):
+                async for event in events:
+                    if event['event'] == 'medications':
+                        event['medications'] = [
+                            _to_medication_record(med).model_dump(mode='json')
+                            for med in event['medications']
+                        ]
+                    if event['event'] != 'complete':
+                        yield event
+                        continue
+                
+                    await executor.run_io(store_analysis, event['result'])
+                    analysis = _to_analysis_result(document_id, event['result'])
+                    yield {'event': 'result', 'result': analysis.model_dump(mode='json')}
+    except HTTPException as e:
+        yield {'event': 'error', 'status_code': e.status_code, 'detail': e.detail}
+    except (DocumentProcessingError, ValueError) as e:
+        error = _unreadable_document(e)
+        yield {'event': 'error', 'status_code': error.status_code, 'detail': error.detail}
+    except Exception as e:
+        yield {'event': 'error', 'status_code': 500, 'detail': str(e) or type(e).__name__}
+
+
+@app.get("/api/documents/{document_id}/stream")
+async def stream_analysis(document_id: str, patient_id: Optional[str] = None):
+    """
+    Analyze a document and stream progress as server-sent events
+    Each event's name is the event type and its data the JSON payload
+    """
+    events = _analysis_events(document_id, patient_id)
+    
+    async def event_source():
+        async for event in events:
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    
+    # Starlette abandons the iterator when the client disconnects; closing
+    # the events afterwards stops the analysis instead of finishing it
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(events.aclose)
+    )
+
+
+@app.websocket("/ws/documents/{document_id}")
+async def stream_analysis_ws(websocket: WebSocket, document_id: str,
+                             patient_id: Optional[str] = None):
+    """
+    Analyze a document and stream progress over a WebSocket
+    Sends the same JSON events as the server-sent events endpoint
+    """
+    await websocket.accept()
+    
+    async def send_events():
+        events = _analysis_events(document_id, patient_id)
+        async with aclosing(events):
+            async for event in events:
+                await websocket.send_json(event)
+    
+    async def wait_for_disconnect():
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+    
+    # Only receiving notices a client that went away, so listen while
+    # sending and cancel the analysis as soon as the client disconnects
+    sender = asyncio.ensure_future(send_events())
+    listener = asyncio.ensure_future(wait_for_disconnect())
+    await asyncio.wait({sender, listener}, return_when=asyncio.FIRST_COMPLETED)
+    listener.cancel()
+    if not sender.done():
+        sender.cancel()
+        return
+    
+    try:
+        sender.result()
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
+
+
+def _iso_date(value: Optional[str]) -> Optional[str]:
+    """Normalise an extracted date to ISO format, as stored in the database"""
+    parsed = parse_clinical_date(value)
+    return parsed.isoformat() if parsed else None
+
+
+def _to_medication_record(med: Dict[str, Any]) -> MedicationRecord:
+    """Convert a pipeline medication dict into the API response model"""
+    return MedicationRecord(
+        drug_name=med['drug_name'],
+        dosage=med['dosage'],
+        start_date=_iso_date(med['start_date']),
+        end_date=_iso_date(med['end_date']),
+        response=med['response']
+    )
+
+
+def _to_analysis_result(document_id: str, result: Dict[str, Any]) -> DocumentAnalysisResult:
+    """Convert a pipeline result into the API response model"""
+    observations = result['mental_status']
+    
     return DocumentAnalysisResult(
         document_id=document_id,
-        patient_id="ANON_001",
-        medications=[
-            MedicationRecord(
-                drug_name="Sertraline",
-                dosage="50mg daily",
-                start_date="2024-01-15",
-                end_date=None,
-                response="Positive",
-                mental_status_changes=["Improved mood", "Reduced anxiety"]
-            )
-        ],
-        missing_data=["End date for current medication"],
-        mental_status_summary="Patient showing improvement in depressive symptoms",
+        patient_id=result['patient_pseudonym'],
+        medications=[_to_medication_record(med) for med in result['medications']],
+        missing_data=result['missing_data'],
+        mental_status_summary=" ".join(observations[:3]) if observations else None,
         anonymised=True,
-        processed_at=datetime.now()
+        processed_at=datetime.now(),
+        paragraphs_total=result.get('paragraphs_total'),
+        paragraphs_reanalysed=result.get('paragraphs_reanalysed')
     )
 
 
-@app.get("/api/medications")
-async def get_medications(patient_id: str):
+@app.get("/api/medications", response_model=MedicationPage)
+def get_medications(
+    patient_id: str,
+    cursor: Optional[int] = None,
+    limit: int = Query(default=settings.medications_page_size, ge=1, le=500),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    session: Session = Depends(get_session),
+):
     """
-    Get medication history for a patient
+    Get medication history for a patient, one page at a time
+    Pass the returned next_cursor back as cursor to fetch the following page
     """
-    # TODO: Implement database query
-    return {
-        "patient_id": patient_id,
-        "medications": []
-    }
+    page = list_medications(
+        session,
+        patient_id,
+        cursor=cursor,
+        limit=limit,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    
+    return MedicationPage(
+        patient_id=patient_id,
+        medications=[
+            MedicationRecord(
+                drug_name=row.drug_name,
+                dosage=row.dosage,
+                start_date=row.start_date.isoformat() if row.start_date else None,
+                end_date=row.end_date.isoformat() if row.end_date else None,
+                response=row.response,
+            )
+            for row in page['medications']
+        ],
+        next_cursor=page['next_cursor']
+    )
 
 
 @app.get("/api/compliance/check")
@@ -0,0 +1,100 @@
+"""Initial schema: documents, medication episodes, mental status, audit events
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'documents',
+        sa.Column('id', sa.String(length=64), primary_key=True),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('file_type', sa.String(length=16), nullable=False),
+        sa.Column('upload_date', sa.DateTime(), nullable=False),
+        sa.Column('patient_pseudonym', sa.String(length=32), nullable=False),
+        sa.Column('anonymised', sa.Boolean(), nullable=False),
+        sa.Column('processed', sa.Boolean(), nullable=False),
+    )
+    op.create_index('ix_documents_patient_upload', 'documents',
+                    ['patient_pseudonym', 'upload_date'])
+
+    op.create_table(
+        'medication_episodes',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('document_id', sa.String(length=64),
+                  sa.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('patient_pseudonym', sa.String(length=32), nullable=False),
+        sa.Column('drug_name', sa.String(length=128), nullable=False),
+        sa.Column('dosage', sa.String(length=64), nullable=True),
+        sa.Column('start_date', sa.Date(), nullable=True),
+        sa.Column('end_date', sa.Date(), nullable=True),
+        sa.Column('response', sa.String(length=16), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_medication_episodes_patient_start', 'medication_episodes',
+                    ['patient_pseudonym', 'start_date'])
+    op.create_index('ix_medication_episodes_patient_id', 'medication_episodes',
+                    ['patient_pseudonym', 'id'])
+    op.create_index('ix_medication_episodes_document', 'medication_episodes',
+                    ['document_id'])
+
+    op.create_table(
+        'mental_status_observations',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('document_id', sa.String(length=64),
+                  sa.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('medication_id', sa.Integer(),
+                  sa.ForeignKey('medication_episodes.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('patient_pseudonym', sa.String(length=32), nullable=False),
+        sa.Column('observation', sa.Text(), nullable=False),
+        sa.Column('recorded_date', sa.Date(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_mental_status_patient_recorded', 'mental_status_observations',
+                    ['patient_pseudonym', 'recorded_date'])
+    op.create_index('ix_mental_status_document', 'mental_status_observations',
+                    ['document_id'])
+
+    op.create_table(
+        'audit_events',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('action', sa.String(length=64), nullable=False),
+        sa.Column('entity_type', sa.String(length=64), nullable=False),
+        sa.Column('entity_id', sa.String(length=64), nullable=True),
+        sa.Column('patient_pseudonym', sa.String(length=32), nullable=True),
+        sa.Column('user_id', sa.String(length=64), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('details', sa.JSON(), nullable=True),
+    )
+    op.create_index('ix_audit_events_patient_timestamp', 'audit_events',
+                    ['patient_pseudonym', 'timestamp'])
+    op.create_index('ix_audit_events_timestamp', 'audit_events', ['timestamp'])
+
+
+def downgrade():
+    op.drop_index('ix_audit_events_timestamp', table_name='audit_events')
+    op.drop_index('ix_audit_events_patient_timestamp', table_name='audit_events')
+    op.drop_table('audit_events')
+
+    op.drop_index('ix_mental_status_document', table_name='mental_status_observations')
+    op.drop_index('ix_mental_status_patient_recorded', table_name='mental_status_observations')
+    op.drop_table('mental_status_observations')
+
+    op.drop_index('ix_medication_episodes_document', table_name='medication_episodes')
+    op.drop_index('ix_medication_episodes_patient_id', table_name='medication_episodes')
+    op.drop_index('ix_medication_episodes_patient_start', table_name='medication_episodes')
+    op.drop_table('medication_episodes')
+
+    op.drop_index('ix_documents_patient_upload', table_name='documents')
+    op.drop_table('documents')
@@ -0,0 +1,38 @@
+"""Document paragraphs for incremental re-analysis
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'document_paragraphs',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('document_id', sa.String(length=64),
+                  sa.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('anonymised_text', sa.Text(), nullable=False),
+        sa.Column('entities_removed', sa.Integer(), nullable=False),
+        sa.Column('entity_types', sa.JSON(), nullable=False),
+        sa.Column('medications', sa.JSON(), nullable=False),
+        sa.Column('mental_status', sa.JSON(), nullable=False),
+    )
+    op.create_index('ix_document_paragraphs_document_position', 'document_paragraphs',
+                    ['document_id', 'position'])
+
+
+def downgrade():
+    op.drop_index('ix_document_paragraphs_document_position', table_name='document_paragraphs')
+    op.drop_table('document_paragraphs')
@@ -0,0 +1,41 @@
+"""Link medication episodes and mental status observations to their paragraph
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('medication_episodes') as batch_op:
+        batch_op.add_column(sa.Column('paragraph_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_medication_episodes_paragraph', 'document_paragraphs',
+                                    ['paragraph_id'], ['id'], ondelete='CASCADE')
+        batch_op.create_index('ix_medication_episodes_paragraph', ['paragraph_id'])
+
+    with op.batch_alter_table('mental_status_observations') as batch_op:
+        batch_op.add_column(sa.Column('paragraph_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_mental_status_paragraph', 'document_paragraphs',
+                                    ['paragraph_id'], ['id'], ondelete='CASCADE')
+        batch_op.create_index('ix_mental_status_paragraph', ['paragraph_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('mental_status_observations') as batch_op:
+        batch_op.drop_index('ix_mental_status_paragraph')
+        batch_op.drop_constraint('fk_mental_status_paragraph', type_='foreignkey')
+        batch_op.drop_column('paragraph_id')
+
+    with op.batch_alter_table('medication_episodes') as batch_op:
+        batch_op.drop_index('ix_medication_episodes_paragraph')
+        batch_op.drop_constraint('fk_medication_episodes_paragraph', type_='foreignkey')
+        batch_op.drop_column('paragraph_id')
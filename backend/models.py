@@ -0,0 +1,154 @@
+"""
+Database schema for persisted documents, medications, mental status and audit events
+"""
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+)
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+
+class Base(DeclarativeBase):
+    """Declarative base shared by all ORM models and alembic migrations"""
+
+
+class DocumentRow(Base):
+    """An uploaded clinical document (its text is stored per paragraph in DocumentParagraphRow)"""
+
+    __tablename__ = "documents"
+
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    file_type: Mapped[str] = mapped_column(String(16), nullable=False)
+    upload_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+    patient_pseudonym: Mapped[str] = mapped_column(String(32), nullable=False)
+    anonymised: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    processed: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        Index("ix_documents_patient_upload", "patient_pseudonym", "upload_date"),
+    )
+
+
+class MedicationEpisodeRow(Base):
+    """
+    A single medication episode extracted from a document
+
+    patient_pseudonym is denormalised from the parent document so that
+    patient/date-range queries do not need a join. paragraph_id links the
+    episode to the stored paragraph it was found in, so re-analysing a
+    revision only replaces the episodes of paragraphs that changed.
+    """
+
+    __tablename__ = "medication_episodes"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    document_id: Mapped[str] = mapped_column(
+        String(64), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False
+    )
+    paragraph_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("document_paragraphs.id", ondelete="CASCADE")
+    )
+    patient_pseudonym: Mapped[str] = mapped_column(String(32), nullable=False)
+    drug_name: Mapped[str] = mapped_column(String(128), nullable=False)
+    dosage: Mapped[Optional[str]] = mapped_column(String(64))
+    start_date: Mapped[Optional[date]] = mapped_column(Date)
+    end_date: Mapped[Optional[date]] = mapped_column(Date)
+    response: Mapped[Optional[str]] = mapped_column(String(16))
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_medication_episodes_patient_start", "patient_pseudonym", "start_date"),
+        Index("ix_medication_episodes_patient_id", "patient_pseudonym", "id"),
+        Index("ix_medication_episodes_document", "document_id"),
+        Index("ix_medication_episodes_paragraph", "paragraph_id"),
+    )
+
+
+class MentalStatusObservationRow(Base):
+    """A mental status observation sentence extracted from a document"""
+
+    __tablename__ = "mental_status_observations"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    document_id: Mapped[str] = mapped_column(
+        String(64), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False
+    )
+    medication_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("medication_episodes.id", ondelete="SET NULL")
+    )
+    paragraph_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("document_paragraphs.id", ondelete="CASCADE")
+    )
+    patient_pseudonym: Mapped[str] = mapped_column(String(32), nullable=False)
+    observation: Mapped[str] = mapped_column(Text, nullable=False)
+    recorded_date: Mapped[Optional[date]] = mapped_column(Date)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_mental_status_patient_recorded", "patient_pseudonym", "recorded_date"),
+        Index("ix_mental_status_document", "document_id"),
+        Index("ix_mental_status_paragraph", "paragraph_id"),
+    )
+
+
+class AuditEventRow(Base):
+    """Immutable audit trail entry (e.g. from PatientAnonymiser.get_audit_log)"""
+
+    __tablename__ = "audit_events"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    action: Mapped[str] = mapped_column(String(64), nullable=False)
+    entity_type: Mapped[str] = mapped_column(String(64), nullable=False)
+    entity_id: Mapped[Optional[str]] = mapped_column(String(64))
+    patient_pseudonym: Mapped[Optional[str]] = mapped_column(String(32))
+    user_id: Mapped[Optional[str]] = mapped_column(String(64))
+    timestamp: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+    details: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON)
+
+    __table_args__ = (
+        Index("ix_audit_events_patient_timestamp", "patient_pseudonym", "timestamp"),
+        Index("ix_audit_events_timestamp", "timestamp"),
+    )
+
+
+class DocumentParagraphRow(Base):
+    """
+    One paragraph of the latest analysed version of a document
+
+    Holds the anonymised paragraph and the entities found in it so that a
+    revised upload only needs to re-analyse the paragraphs that changed.
+    The content hash is an HMAC of the original paragraph.
+
+    Anonymisation redacts NHS numbers, postcodes, phone numbers, email
+    addresses and street addresses only: names and dates (including dates
+    of birth) are kept, so anonymised_text is still patient-identifiable.
+    """
+
+    __tablename__ = "document_paragraphs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    document_id: Mapped[str] = mapped_column(
+        String(64), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False
+    )
+    position: Mapped[int] = mapped_column(Integer, nullable=False)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    anonymised_text: Mapped[str] = mapped_column(Text, nullable=False)
+    entities_removed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    entity_types: Mapped[List[str]] = mapped_column(JSON, nullable=False)
+    medications: Mapped[List[Dict[str, Any]]] = mapped_column(JSON, nullable=False)
+    mental_status: Mapped[List[str]] = mapped_column(JSON, nullable=False)
+
+    __table_args__ = (
+        Index("ix_document_paragraphs_document_position", "document_id", "position"),
+    )
@@ -0,0 +1,305 @@
+"""
+Document analysis pipeline run inside worker processes
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from .config import settings
+from .incremental import analyse_paragraphs, context_start, paragraph_hash, split_paragraphs
+
+# Each page is diffed against this many times its line count of stored
+# paragraphs, starting after the last one matched, instead of against the
+# whole rest of the stored document
+STORED_WINDOW_PAGES = 2
+
+# Per-process components, created on first use so that each worker process
+# loads the spaCy model once and the API process never loads it at all
+_processor = None
+_anonymiser = None
+_nlp = None
+
+
+def _get_components():
+    """Create (once per process) the processor, anonymiser and NLP objects"""
+    global _processor, _anonymiser, _nlp
+
+    if _processor is None:
+        from .anonymiser import PatientAnonymiser
+        from .clinical_nlp import ClinicalNLP
+        from .document_processor import DocumentProcessor
+
+        _processor = DocumentProcessor()
+        _anonymiser = PatientAnonymiser(settings.anonymisation_level)
+        _nlp = ClinicalNLP(settings.ner_model)
+
+    return _processor, _anonymiser, _nlp
+
+
+def analyse_document(file_path: str, document_id: str,
+                     patient_id: Optional[str] = None,
+                     previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Run extraction, anonymisation and entity extraction on a stored document
+
+    This is CPU-bound (PDF parsing, OCR, spaCy) and must be called through
+    the process pool rather than directly from an async route. When the
+    stored analysis of a previous version is given, only paragraphs that
+    changed (and their neighbouring context) are anonymised and analysed
+    again; see incremental.analyse_paragraphs.
+
+    Args:
+        file_path: Path to the uploaded document
+        document_id: Document identifier
+        patient_id: Optional patient identifier for consistent pseudonymisation
+        previous: Stored analysis of the previous version, as returned by
+            database.load_previous_analysis
+
+    Returns:
+        Analysis result in the shape accepted by database.save_analysis_results
+    """
+    processor, anonymiser, nlp = _get_components()
+
+    extracted = processor.process_document(file_path)
+    text = extracted['text']
+
+    # Keep the pseudonym of the previous version unless a patient id is
+    # given, since editing the opening lines would otherwise change it
+    if patient_id is None and previous is not None:
+        pseudonym = previous['patient_pseudonym']
+    else:
+        pseudonym = anonymiser._generate_pseudonym(patient_id or text[:50])
+
+    analysis = analyse_paragraphs(
+        text, anonymiser, nlp, patient_id or text[:50],
+        previous['paragraphs'] if previous else None
+    )
+
+    return {
+        'document_id': document_id,
+        'filename': Path(file_path).name,
+        'format': extracted['format'],
+        'patient_pseudonym': pseudonym,
+        'medications': analysis['medications'],
+        'mental_status': analysis['mental_status'],
+        'missing_data': nlp.detect_missing_data(analysis['medications']),
+        'paragraphs': analysis['paragraphs'],
+        'paragraphs_total': len(analysis['paragraphs']),
+        'paragraphs_reanalysed': analysis['paragraphs_reanalysed'],
+        'audit_log': [{
+            'timestamp': datetime.now().isoformat(),
+            'patient_pseudonym': pseudonym,
+            'entities_removed': analysis['entities_removed'],
+            'entity_types': analysis['entity_types'],
+            'document_id': document_id,
+        }],
+    }
+
+
+def _stored_window(stored: List[Dict[str, Any]], start: int, page_text: str) -> int:
+    """
+    End of the stored paragraphs a page is diffed against
+
+    The window normally covers STORED_WINDOW_PAGES times the page's lines.
+    When none of its lines are in the window (pages were deleted), it is
+    extended to the first stored paragraph that is, so the rest of the
+    document can still be reused.
+
+    Args:
+        stored: Stored paragraph records of the previous version
+        start: Position of the first stored paragraph not yet matched
+        page_text: Extracted text of the page
+
+    Returns:
+        Position in `stored` at which the window ends
+    """
+    if start >= len(stored):
+        return start
+    size = STORED_WINDOW_PAGES * (page_text.count("\n") + 1)
+    # Lines rather than paragraphs: only a wrapped identifier differs
+    hashes = {paragraph_hash(line) for line in split_paragraphs(page_text)}
+    stop = min(start + size, len(stored))
+    if any(record['content_hash'] in hashes for record in stored[start:stop]):
+        return stop
+    for position in range(stop, len(stored)):
+        if stored[position]['content_hash'] in hashes:
+            return min(position + size, len(stored))
+    return stop
+
+
+def iter_document_analysis(file_path: str, document_id: str,
+                           patient_id: Optional[str] = None,
+                           previous: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Analyse a document page by page, yielding progress events as it goes
+
+    Each page is extracted and analysed with incremental.analyse_paragraphs
+    together with the trailing paragraphs it can still affect: only the new
+    page's paragraphs are anonymised, and entities are re-extracted only
+    where their context reaches into it. With a previous version, each page
+    is diffed against the stored paragraphs following the last one matched
+    (see _stored_window), and stored results are kept across page breaks
+    unless the next page differs. The first findings are available
+    after one page, and the final result is the same as analyse_document's,
+    paragraph records included, unless a sentence runs on for several
+    hundred characters before its first observation keyword and a page
+    break falls in between. Events are dictionaries with an 'event' key:
+
+    - 'page': a page was processed ('page', 'total_pages')
+    - 'medications': medications found on a page ('page', 'medications')
+    - 'complete': the aggregated result ('result', same shape as
+      analyse_document)
+
+    Args:
+        file_path: Path to the uploaded document
+        document_id: Document identifier
+        patient_id: Optional patient identifier for consistent pseudonymisation
+        previous: Stored analysis of the previous version, as returned by
+            database.load_previous_analysis
+
+    Yields:
+        Progress event dictionaries
+    """
+    processor, anonymiser, nlp = _get_components()
+
+    # Stored paragraphs from next_stored on are not yet matched by the pages
+    # read so far; a window of them is offered to each page's diff
+    stored = previous['paragraphs'] if previous else []
+    stored_positions = {record['id']: position for position, record in enumerate(stored)}
+    next_stored = 0
+
+    # Only the paragraphs a new page can still affect are analysed again
+    # with it; the open records listed in `incomplete` were extracted
+    # without the text that follows them
+    settled = []
+    open_paragraphs = []
+    open_records = []
+    incomplete = []
+
+    # Positions in the document of every paragraph re-extracted on any page
+    reanalysed = set()
+
+    seed = None
+    entity_types = set()
+    entities_removed = 0
+    file_format = Path(file_path).suffix.lower().replace('.', '')
+
+    for page_number, total_pages, page_text in processor.iter_pages(file_path):
+        # Without a patient id the whole-document path seeds the pseudonym
+        # from the opening text; use the first page for the same result
+        if seed is None:
+            seed = patient_id or page_text[:50]
+
+        text = "\n".join(open_paragraphs + [page_text])
+        # The last page sees the whole stored tail, so paragraphs deleted
+        # from the end of the document are noticed
+        last_page = page_number == total_pages
+        if last_page:
+            window = stored[next_stored:]
+        else:
+            window = stored[next_stored:_stored_window(stored, next_stored, page_text)]
+        analysis = analyse_paragraphs(
+            text, anonymiser, nlp, seed, open_records + window,
+            reextract=incomplete, continued=not last_page
+        )
+        records = analysis['paragraphs']
+        reanalysed.update(len(settled) + index for index in analysis['reanalysed'])
+        entities_removed += analysis['entities_removed']
+        entity_types.update(analysis['entity_types'])
+
+        # Paragraphs from the end of the previous page may have been
+        # re-split, so the page starts after the records that still match
+        first_new = 0
+        while first_new < min(len(open_records), len(records)) and \
+                records[first_new]['content_hash'] == open_records[first_new]['content_hash']:
+            first_new += 1
+        reused = [stored_positions[record['id']] for record in records if 'id' in record]
+        if reused:
+            next_stored = max(next_stored, max(reused) + 1)
+
+        page_medications = [med for record in records[first_new:] for med in record['medications']]
+        yield {'event': 'page', 'page': page_number, 'total_pages': total_pages}
+        if page_medications:
+            yield {
+                'event': 'medications',
+                'page': page_number,
+                'medications': [
+                    {key: value for key, value in med.items() if key != 'context'}
+                    for med in page_medications
+                ],
+            }
+
+        # Records extracted near the end of the text are handled as edited
+        # with the next page, so the records they are context for, and those
+        # records' own context, stay open too; everything before is settled.
+        # Stored records kept as they were need nothing more unless the next
+        # page differs from what followed them
+        end = context_start(records)
+        cut = context_start(records, context_start(records, end))
+        settled.extend(records[:cut])
+        open_records = records[cut:]
+        open_paragraphs = split_paragraphs(text, anonymiser)[cut:]
+        incomplete = [index - cut for index in analysis['reanalysed'] if index >= end]
+
+    if patient_id is None and previous is not None:
+        pseudonym = previous['patient_pseudonym']
+    else:
+        # A document without any pages falls back to its id
+        pseudonym = anonymiser._generate_pseudonym(seed or document_id)
+
+    records = settled + open_records
+
+    # A stored paragraph at the end of a page is re-extracted before the
+    # next page is read, so compare the final entities with the stored row
+    for record in records:
+        if 'id' in record:
+            row = stored[stored_positions[record['id']]]
+            record['modified'] = (record['medications'], record['mental_status']) != \
+                (row['medications'], row['mental_status'])
+        else:
+            # New paragraphs carried over a page break were matched as unchanged
+            record['modified'] = True
+
+    medications = [med for record in records for med in record['medications']]
+    yield {
+        'event': 'complete',
+        'result': {
+            'document_id': document_id,
+            'filename': Path(file_path).name,
+            'format': file_format,
+            'patient_pseudonym': pseudonym,
+            'medications': medications,
+            'mental_status': [obs for record in records for obs in record['mental_status']],
+            'missing_data': nlp.detect_missing_data(medications),
+            'paragraphs': records,
+            'paragraphs_total': len(records),
+            # Paragraphs at a page break can be merged once the next page is read
+            'paragraphs_reanalysed': len([index for index in reanalysed if index < len(records)]),
+            'audit_log': [{
+                'timestamp': datetime.now().isoformat(),
+                'patient_pseudonym': pseudonym,
+                'entities_removed': entities_removed,
+                'entity_types': sorted(entity_types),
+                'document_id': document_id,
+            }],
+        },
+    }
+
+
+def stream_document_analysis(queue, cancelled, file_path: str, document_id: str,
+                             patient_id: Optional[str] = None,
+                             previous: Optional[Dict[str, Any]] = None):
+    """
+    Process-pool entry point for iter_document_analysis
+
+    Puts each event on `queue` (a multiprocessing manager queue) and always
+    finishes with None so the reader knows the stream has ended. Stops
+    before the next page once `cancelled` (a manager event) is set.
+    """
+    try:
+        for event in iter_document_analysis(file_path, document_id, patient_id, previous):
+            if cancelled.is_set():
+                break
+            queue.put(event)
+    finally:
+        queue.put(None)
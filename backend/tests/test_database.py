@@ -0,0 +1,202 @@
+"""
+Tests for the persistence layer
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import (
+    create_db_engine,
+    init_db,
+    list_medications,
+    parse_clinical_date,
+    save_analysis_results,
+)
+from backend.models import DocumentParagraphRow, DocumentRow, MedicationEpisodeRow
+
+
+@pytest.fixture
+def session():
+    """Session on a fresh in-memory SQLite database"""
+    engine = create_db_engine("sqlite://")
+    init_db(engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+    engine.dispose()
+
+
+def _result(document_id, pseudonym, medications):
+    return {
+        'document_id': document_id,
+        'filename': f"{document_id}.docx",
+        'format': 'docx',
+        'patient_pseudonym': pseudonym,
+        'medications': medications,
+        'mental_status': [],
+    }
+
+
+def _medication(name, start_date=None):
+    return {'drug_name': name, 'dosage': '50mg', 'start_date': start_date,
+            'end_date': None, 'response': None}
+
+
+def test_parse_clinical_date_is_day_first():
+    assert parse_clinical_date("05/01/2024") == date(2024, 1, 5)
+    assert parse_clinical_date("Jan 15, 2024") == date(2024, 1, 15)
+    assert parse_clinical_date("not a date") is None
+    assert parse_clinical_date(None) is None
+
+
+def test_list_medications_pages_with_cursor(session):
+    save_analysis_results(session, [
+        _result("doc_a", "PATIENT_A", [_medication(f"Drug{i}") for i in range(5)]),
+        _result("doc_b", "PATIENT_B", [_medication("Other")]),
+    ])
+    session.commit()
+
+    names = []
+    cursor = None
+    pages = 0
+    while True:
+        page = list_medications(session, "PATIENT_A", cursor=cursor, limit=2)
+        names.extend(row.drug_name for row in page['medications'])
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert names == [f"Drug{i}" for i in range(5)]
+    assert pages == 3
+
+
+def test_list_medications_last_full_page_has_no_cursor(session):
+    save_analysis_results(session, [
+        _result("doc_a", "PATIENT_A", [_medication(f"Drug{i}") for i in range(4)]),
+    ])
+    session.commit()
+
+    first = list_medications(session, "PATIENT_A", limit=2)
+    second = list_medications(session, "PATIENT_A", cursor=first['next_cursor'], limit=2)
+
+    assert len(second['medications']) == 2
+    assert second['next_cursor'] is None
+
+
+def test_list_medications_filters_by_start_date(session):
+    save_analysis_results(session, [
+        _result("doc_a", "PATIENT_A", [
+            _medication("Early", "01/02/2023"),
+            _medication("Late", "01/02/2024"),
+            _medication("Undated"),
+        ]),
+    ])
+    session.commit()
+
+    page = list_medications(session, "PATIENT_A", start_date=date(2024, 1, 1))
+
+    assert [row.drug_name for row in page['medications']] == ["Late"]
+    assert page['medications'][0].start_date == date(2024, 2, 1)
+
+
+def _paragraph(text, drug=None, **extra):
+    record = {
+        'content_hash': text,
+        'anonymised_text': text,
+        'entities_removed': 0,
+        'entity_types': [],
+        'medications': [_medication(drug)] if drug else [],
+        'mental_status': [],
+        'modified': True,
+    }
+    record.update(extra)
+    return record
+
+
+def _stored_paragraphs(session, document_id):
+    """Stored paragraphs as load_previous_analysis returns them, marked unmodified"""
+    rows = session.scalars(
+        select(DocumentParagraphRow)
+        .where(DocumentParagraphRow.document_id == document_id)
+        .order_by(DocumentParagraphRow.position)
+    ).all()
+    return [
+        _paragraph(row.anonymised_text, id=row.id, medications=row.medications, modified=False)
+        for row in rows
+    ]
+
+
+def _medication_ids(session):
+    return dict(session.execute(
+        select(MedicationEpisodeRow.drug_name, MedicationEpisodeRow.id)
+    ).all())
+
+
+def _save_paragraphs(session, paragraphs):
+    result = _result("doc_a", "PATIENT_A", [])
+    result['paragraphs'] = paragraphs
+    counts = save_analysis_results(session, [result])
+    session.commit()
+    return counts
+
+
+def test_revision_only_rewrites_modified_paragraphs(session):
+    _save_paragraphs(session, [_paragraph(f"Line {i}", f"Drug{i}") for i in range(3)])
+    before = _medication_ids(session)
+
+    paragraphs = _stored_paragraphs(session, "doc_a")
+    paragraphs[1] = _paragraph("Line 1 revised", "Revised", id=paragraphs[1]['id'])
+    counts = _save_paragraphs(session, paragraphs)
+
+    after = _medication_ids(session)
+    assert counts['document_paragraphs'] == 1
+    assert counts['medication_episodes'] == 1
+    assert after['Drug0'] == before['Drug0']
+    assert after['Drug2'] == before['Drug2']
+    assert 'Drug1' not in after
+    assert after['Revised'] > max(before.values())
+
+
+def test_revision_deletes_and_moves_paragraphs(session):
+    _save_paragraphs(session, [_paragraph(f"Line {i}", f"Drug{i}") for i in range(3)])
+    before = _medication_ids(session)
+
+    paragraphs = _stored_paragraphs(session, "doc_a")[1:]
+    counts = _save_paragraphs(session, paragraphs)
+
+    stored = _stored_paragraphs(session, "doc_a")
+    assert [paragraph['anonymised_text'] for paragraph in stored] == ["Line 1", "Line 2"]
+    assert counts['medication_episodes'] == 0
+    assert _medication_ids(session) == {'Drug1': before['Drug1'], 'Drug2': before['Drug2']}
+
+
+def test_cursor_stays_valid_across_revisions(session):
+    _save_paragraphs(session, [_paragraph(f"Line {i}", f"Drug{i}") for i in range(4)])
+    first = list_medications(session, "PATIENT_A", limit=2)
+
+    paragraphs = _stored_paragraphs(session, "doc_a")
+    paragraphs.insert(0, _paragraph("New first line", "Inserted"))
+    _save_paragraphs(session, paragraphs)
+
+    rest = list_medications(session, "PATIENT_A", cursor=first['next_cursor'], limit=10)
+    names = [row.drug_name for row in first['medications'] + rest['medications']]
+    assert names == ["Drug0", "Drug1", "Drug2", "Drug3", "Inserted"]
+
+
+def _upload_date(session, document_id):
+    return session.execute(
+        select(DocumentRow.upload_date).where(DocumentRow.id == document_id)
+    ).scalar_one()
+
+
+def test_reanalysis_keeps_upload_date(session):
+    save_analysis_results(session, [_result("doc_a", "PATIENT_A", [_medication("Sertraline")])])
+    session.commit()
+    uploaded = _upload_date(session, "doc_a")
+
+    save_analysis_results(session, [_result("doc_a", "PATIENT_A", [_medication("Lithium")])])
+    session.commit()
+
+    assert _upload_date(session, "doc_a") == uploaded
@@ -0,0 +1,23 @@
+"""
+Tests for text extraction
+"""
+from PyPDF2 import PdfWriter
+
+from backend.document_processor import DocumentProcessor
+
+
+def test_scanned_pdf_pages_are_ocred(tmp_path, monkeypatch):
+    path = tmp_path / "referral.pdf"
+    writer = PdfWriter()
+    for _ in range(2):
+        writer.add_blank_page(width=612, height=792)
+    with open(path, 'wb') as file:
+        writer.write(file)
+    processor = DocumentProcessor()
+    monkeypatch.setattr(processor, '_ocr_pdf_page',
+                        lambda file_path, page_number: f"Scanned page {page_number}")
+
+    text = processor.process_document(str(path))['text']
+
+    assert text == "Scanned page 1\nScanned page 2"
+    assert text == "\n".join(page for _, _, page in processor.iter_pages(str(path)))
@@ -0,0 +1,53 @@
+"""
+Tests for the columnar entity store
+"""
+from datetime import date
+
+import pytest
+
+from backend.entity_store import EntityStore
+
+TEXT = "Started sertraline 50mg on 15/01/2024. Lithium from early spring was stopped."
+
+
+@pytest.fixture
+def store():
+    store = EntityStore()
+    store.add_document("doc_a", TEXT)
+    store.append_medication("Sertraline", 8, 18, "50mg", "15/01/2024", None, "Positive")
+    store.append_medication("Lithium", 39, 46, None, "early spring", None, None)
+    store.append_observation(0, 38)
+    store.add_document("doc_b", "Started lithium 400mg.")
+    store.append_medication("Lithium", 8, 15, "400mg", "Mar 3, 2023")
+    return store
+
+
+def test_medications_round_trip_dates_as_extracted(store):
+    medications = list(store.iter_medications("doc_a"))
+
+    assert medications == [
+        {'drug_name': 'Sertraline', 'dosage': '50mg', 'start_date': '15/01/2024',
+         'end_date': None, 'response': 'Positive'},
+        {'drug_name': 'Lithium', 'dosage': None, 'start_date': 'early spring',
+         'end_date': None, 'response': None},
+    ]
+
+
+def test_date_range_uses_parsed_dates(store):
+    found = store.iter_medications(start_date=date(2023, 1, 1), end_date=date(2023, 12, 31))
+
+    assert [med['start_date'] for med in found] == ['Mar 3, 2023']
+
+
+def test_context_and_observations_are_sliced_from_text(store):
+    medication = store.medication(0, include_context=True)
+
+    assert medication['context'] == TEXT
+    assert store.mental_status("doc_a") == [TEXT[:38].lower()]
+    assert store.mental_status("doc_b") == []
+    assert len(store) == 4
+
+
+def test_entities_need_a_document():
+    with pytest.raises(ValueError):
+        EntityStore().append_observation(0, 1)
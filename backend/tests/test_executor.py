@@ -0,0 +1,184 @@
+"""
+Tests for the execution layer's endpoint limits and timeouts
+"""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from backend.executor import EndpointLimiter, ExecutionLayer
+
+
+@pytest.fixture
+def layer():
+    layer = ExecutionLayer(cpu_workers=1, io_workers=1)
+    yield layer
+    layer.shutdown()
+
+
+def test_limiter_rejects_when_full():
+    async def scenario():
+        limiter = EndpointLimiter('test', max_concurrent=1, queue_timeout=0.05)
+        async with limiter:
+            with pytest.raises(HTTPException) as raised:
+                async with limiter:
+                    pass
+        assert raised.value.status_code == 503
+
+        # The slot is free again once the first request is done
+        async with limiter:
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_run_io_returns_result(layer):
+    async def scenario():
+        return await layer.run_io(sum, [1, 2, 3])
+
+    assert asyncio.run(scenario()) == 6
+
+
+def test_timeout_holds_slot_until_job_finishes(layer):
+    release = threading.Event()
+
+    async def scenario():
+        limiter = EndpointLimiter('test', max_concurrent=1, queue_timeout=0.05)
+
+        with pytest.raises(HTTPException) as raised:
+            async with limiter:
+                await layer.run_io(release.wait, 5, timeout=0.05)
+        assert raised.value.status_code == 504
+
+        # The job is still running, so its slot is still taken
+        with pytest.raises(HTTPException) as raised:
+            async with limiter:
+                pass
+        assert raised.value.status_code == 503
+
+        release.set()
+        await asyncio.sleep(0.1)
+        async with limiter:
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_timeout_drops_queued_job(layer):
+    release = threading.Event()
+    ran = []
+
+    async def scenario():
+        limiter = EndpointLimiter('test', max_concurrent=2, queue_timeout=0.05)
+
+        # Occupies the only I/O thread
+        blocker = asyncio.ensure_future(layer.run_io(release.wait, 5))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(HTTPException):
+            async with limiter:
+                await layer.run_io(ran.append, 'queued', timeout=0.05)
+
+        release.set()
+        await blocker
+        await asyncio.sleep(0.05)
+
+        # The dropped job never ran and did not keep its slot
+        async with limiter:
+            async with limiter:
+                pass
+
+    asyncio.run(scenario())
+    assert ran == []
+
+
+def test_cpu_timeout_holds_slot_until_worker_finishes(layer):
+    async def scenario():
+        limiter = EndpointLimiter('test', max_concurrent=1, queue_timeout=0.05)
+        # Start the worker process first so the job below is running when it times out
+        await layer.run_cpu(abs, -1)
+
+        with pytest.raises(HTTPException) as raised:
+            async with limiter:
+                await layer.run_cpu(time.sleep, 1, timeout=0.1)
+        assert raised.value.status_code == 504
+
+        with pytest.raises(HTTPException):
+            async with limiter:
+                pass
+
+        await asyncio.sleep(1.5)
+        async with limiter:
+            pass
+
+    asyncio.run(scenario())
+
+
+def _ticker(items, cancelled, path):
+    """Producer emitting a tick every 50 ms until cancelled; records its end"""
+    ticks = 0
+    try:
+        while not cancelled.is_set() and ticks < 100:
+            items.put(ticks)
+            ticks += 1
+            time.sleep(0.05)
+    finally:
+        items.put(None)
+        with open(path, 'w') as f:
+            f.write(str(ticks))
+
+
+def test_closing_stream_cancels_producer(layer, tmp_path):
+    path = tmp_path / "ticks"
+
+    async def scenario():
+        limiter = EndpointLimiter('test', max_concurrent=1, queue_timeout=0.05)
+        async with limiter:
+            stream = layer.stream_cpu(_ticker, str(path))
+            received = [await stream.__anext__() for _ in range(3)]
+            await stream.aclose()
+        assert received == [0, 1, 2]
+
+        # Give the producer time to notice the event and return
+        deadline = time.monotonic() + 5
+        while not path.exists() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.1)
+        async with limiter:
+            pass
+
+    asyncio.run(scenario())
+    assert int(path.read_text()) < 20
+
+
+def test_crashed_worker_is_replaced(layer):
+    async def scenario():
+        with pytest.raises(HTTPException) as raised:
+            await layer.run_cpu(os._exit, 1)
+        assert raised.value.status_code == 503
+
+        # The broken pool has been dropped, so later jobs run in a new one
+        assert await layer.run_cpu(abs, -1) == 1
+        assert await layer.run_cpu(abs, -2) == 2
+
+    asyncio.run(scenario())
+
+
+def _crash(items, cancelled):
+    """Producer whose worker process dies before emitting anything"""
+    os._exit(1)
+
+
+def test_crashed_stream_worker_is_replaced(layer):
+    async def scenario():
+        with pytest.raises(HTTPException) as raised:
+            async for _ in layer.stream_cpu(_crash):
+                pass
+        assert raised.value.status_code == 503
+
+        assert await layer.run_cpu(abs, -1) == 1
+
+    asyncio.run(scenario())
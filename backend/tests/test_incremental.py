@@ -0,0 +1,318 @@
+"""
+Tests for paragraph-level incremental analysis
+"""
+import hashlib
+import re
+
+import pytest
+
+from backend import pipeline
+from backend.anonymiser import PatientAnonymiser
+from backend.incremental import analyse_paragraphs, paragraph_hash, split_paragraphs
+
+DRUG = re.compile(r'\b(?:sertraline|lithium|quetiapine)\b', re.IGNORECASE)
+OBSERVATION = re.compile(r'[^.\n]*\bmood\b[^.\n]*', re.IGNORECASE)
+SENTENCE = re.compile(r'[^.\s][^.]*\.?')
+
+
+class FakeNLP:
+    """Stands in for ClinicalNLP, with the same context windows but no spaCy"""
+
+    def iter_medication_matches(self, text):
+        for match in DRUG.finditer(text):
+            context = text[max(0, match.start() - 100):match.end() + 100]
+            yield match.start(), match.end(), {
+                'drug_name': match.group(0).title(),
+                'dosage': None,
+                'start_date': None,
+                'end_date': None,
+                'context': context,
+            }
+
+    def iter_mental_status_spans(self, text):
+        for match in OBSERVATION.finditer(text):
+            yield match.start(), match.end()
+
+    def assess_medication_response(self, text, medication, start=0):
+        match = re.compile(rf'\b{re.escape(medication)}\b', re.IGNORECASE).search(text, start)
+        context = text[max(0, match.start() - 200):match.end() + 200].lower()
+        return 'Positive' if 'improved' in context else None
+
+    def detect_missing_data(self, medication_records):
+        return []
+
+
+class SentenceNLP(FakeNLP):
+    """FakeNLP whose sentences end only at full stops, so they can span lines"""
+
+    def iter_mental_status_spans(self, text):
+        for match in SENTENCE.finditer(text):
+            if 'mood' in match.group(0).lower():
+                yield match.start(), match.start() + len(match.group(0).rstrip())
+
+
+class FakeProcessor:
+    """Stands in for DocumentProcessor, serving fixed pages of text"""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def process_document(self, file_path):
+        return {'text': "\n".join(self.pages), 'format': 'pdf'}
+
+    def iter_pages(self, file_path):
+        for number, page in enumerate(self.pages, 1):
+            yield number, len(self.pages), page
+
+
+@pytest.fixture
+def anonymiser():
+    return PatientAnonymiser()
+
+
+@pytest.fixture
+def serve_pages(monkeypatch, anonymiser):
+    """Make the pipeline read the given pages, using the fake components"""
+    def serve(lines, page_size=4):
+        pages = ["\n".join(lines[start:start + page_size]) for start in range(0, len(lines), page_size)]
+        monkeypatch.setattr(
+            pipeline, '_get_components', lambda: (FakeProcessor(pages), anonymiser, FakeNLP())
+        )
+    return serve
+
+
+def _letter():
+    lines = []
+    for index in range(60):
+        if index % 6 == 0:
+            lines.append(f"Started {['sertraline', 'lithium', 'quetiapine'][index % 3]} in clinic.")
+        elif index % 6 == 3:
+            lines.append(f"Mood low at review {index}.")
+        else:
+            lines.append(f"Review {index}: attended with partner and discussed work.")
+    return lines
+
+
+def _analyse(lines, anonymiser, previous=None):
+    return analyse_paragraphs("\n".join(lines), anonymiser, FakeNLP(), "patient", previous)
+
+
+def _stored(result):
+    """A result's paragraphs as database.load_previous_analysis returns them"""
+    return {
+        'patient_pseudonym': result['patient_pseudonym'],
+        'paragraphs': [
+            {**{key: value for key, value in record.items() if key != 'modified'}, 'id': row_id}
+            for row_id, record in enumerate(result['paragraphs'], 1)
+        ],
+    }
+
+
+def _assert_same_analysis(incremental, full):
+    for key in ('anonymised_text', 'medications', 'mental_status'):
+        assert incremental[key] == full[key]
+    assert [record['content_hash'] for record in incremental['paragraphs']] == \
+        [record['content_hash'] for record in full['paragraphs']]
+
+
+def test_identifiers_wrapped_across_lines_are_redacted(anonymiser):
+    text = "Patient lives at 12 Acacia\nRoad. NHS 943 476\n5919"
+    expected = anonymiser.anonymise_text(text, "patient")['anonymised_text']
+
+    result = analyse_paragraphs(text, anonymiser, FakeNLP(), "patient")
+
+    assert result['anonymised_text'] == expected
+    assert "Acacia" not in result['anonymised_text']
+    assert "5919" not in result['anonymised_text']
+
+
+def test_editing_next_to_a_wrapped_identifier_keeps_it_redacted(anonymiser):
+    lines = ["Seen in clinic.", "NHS 943 476", "5919 confirmed.", "Plan agreed."]
+    first = _analyse(lines, anonymiser)
+
+    lines[0] = "Seen at home."
+    revised = _analyse(lines, anonymiser, first['paragraphs'])
+
+    assert "5919" not in revised['anonymised_text']
+    _assert_same_analysis(revised, _analyse(lines, anonymiser))
+
+
+def test_split_paragraphs_keeps_lines_an_identifier_spans(anonymiser):
+    text = "Line one\n\n  NHS 943 476\n5919 noted  \nLine three"
+
+    assert split_paragraphs(text) == ["Line one", "NHS 943 476", "5919 noted", "Line three"]
+    assert split_paragraphs(text, anonymiser) == ["Line one", "NHS 943 476\n5919 noted", "Line three"]
+
+
+@pytest.mark.parametrize("edit", [
+    lambda lines: lines.__delitem__(0),
+    lambda lines: lines.__delitem__(slice(0, 3)),
+    lambda lines: lines.__delitem__(-1),
+    lambda lines: lines.__delitem__(slice(-4, None)),
+    lambda lines: lines.__delitem__(slice(25, 31)),
+    lambda lines: lines.insert(0, "Lithium improved things."),
+    lambda lines: lines.append("Sertraline stopped; mood improved."),
+    lambda lines: lines.__setitem__(31, "Everything improved."),
+], ids=["delete-first", "delete-head", "delete-last", "delete-tail", "delete-middle",
+        "insert-first", "append", "edit-middle"])
+def test_revision_matches_full_analysis(anonymiser, edit):
+    lines = _letter()
+    first = _analyse(lines, anonymiser)
+
+    edit(lines)
+    revised = _analyse(lines, anonymiser, first['paragraphs'])
+
+    _assert_same_analysis(revised, _analyse(lines, anonymiser))
+    assert revised['paragraphs_reanalysed'] < len(revised['paragraphs'])
+
+
+def test_edit_reextracts_neighbours_within_context(anonymiser):
+    lines = _letter()
+    first = _analyse(lines, anonymiser)
+    assert first['paragraphs'][30]['medications'][0]['response'] is None
+
+    # The drug mentioned on line 30 now has a positive indicator one line later
+    lines[31] = "Much improved since then."
+    revised = _analyse(lines, anonymiser, first['paragraphs'])
+
+    assert revised['paragraphs'][30]['medications'][0]['response'] == 'Positive'
+    assert revised['paragraphs_anonymised'] == 1
+    assert revised['paragraphs_reanalysed'] < 15
+    # Only the edit and the paragraph whose result changed need writing back
+    modified = [index for index, record in enumerate(revised['paragraphs']) if record['modified']]
+    assert modified == [30, 31]
+
+
+def test_unchanged_document_is_not_reanalysed(anonymiser):
+    lines = _letter()
+    first = _analyse(lines, anonymiser)
+
+    revised = _analyse(lines, anonymiser, first['paragraphs'])
+
+    assert revised['paragraphs_anonymised'] == 0
+    assert revised['paragraphs_reanalysed'] == 0
+    assert revised['entities_removed'] == 0
+
+
+def _wrapped_letter():
+    """A letter whose sentences are wrapped over many lines without full stops"""
+    lines = ["Seen in clinic today."]
+    for sentence in range(4):
+        lines += [f"patient attended review {sentence}-{line} with partner and discussed work"
+                  for line in range(10)]
+        lines.append("overall mood is stable." if sentence % 2 else "plan agreed.")
+    return lines
+
+
+@pytest.mark.parametrize("edit", [
+    lambda lines: lines.__setitem__(21, "overall is worse."),
+    lambda lines: lines.__setitem__(11, "overall mood is low."),
+    lambda lines: lines.__setitem__(11, "overall mood is low"),
+    lambda lines: lines.__setitem__(21, "overall is worse"),
+    lambda lines: lines.__delitem__(21),
+    lambda lines: lines.insert(5, "mood low."),
+], ids=["drop-observation", "add-observation", "join-sentences", "join-and-drop",
+        "delete-sentence-end", "split-sentence"])
+def test_revision_of_sentences_spanning_lines(anonymiser, edit):
+    lines = _wrapped_letter()
+    first = analyse_paragraphs("\n".join(lines), anonymiser, SentenceNLP(), "patient")
+    assert len(first['mental_status'][0]) > 500
+
+    edit(lines)
+    revised = analyse_paragraphs("\n".join(lines), anonymiser, SentenceNLP(), "patient",
+                                 first['paragraphs'])
+
+    _assert_same_analysis(
+        revised, analyse_paragraphs("\n".join(lines), anonymiser, SentenceNLP(), "patient")
+    )
+
+
+def test_paragraph_hash_is_keyed():
+    assert paragraph_hash("DOB: 01/02/1980") != hashlib.sha256(b"DOB: 01/02/1980").hexdigest()
+    assert paragraph_hash("DOB: 01/02/1980") == paragraph_hash("DOB: 01/02/1980")
+
+
+def test_streaming_matches_whole_document(anonymiser, serve_pages):
+    lines = _letter()
+    lines[9:11] = ["NHS 943 476", "5919 confirmed, mood improved."]
+    serve_pages(lines)
+
+    full = pipeline.analyse_document("letter.pdf", "doc")
+    events = list(pipeline.iter_document_analysis("letter.pdf", "doc"))
+    streamed = events[-1]['result']
+
+    assert [record['content_hash'] for record in streamed['paragraphs']] == \
+        [record['content_hash'] for record in full['paragraphs']]
+    for key in ('medications', 'mental_status', 'patient_pseudonym'):
+        assert streamed[key] == full[key]
+    assert streamed['paragraphs_reanalysed'] == full['paragraphs_reanalysed'] == len(full['paragraphs'])
+    assert "5919" not in "".join(record['anonymised_text'] for record in streamed['paragraphs'])
+    # Each medication is reported once, on the page it was found
+    reported = [med for event in events if event['event'] == 'medications' for med in event['medications']]
+    assert len(reported) == len(full['medications'])
+
+
+@pytest.mark.parametrize("edit", [
+    lambda lines: None,
+    lambda lines: lines.__delitem__(slice(25, 31)),
+    lambda lines: lines.insert(12, "Lithium improved things."),
+    lambda lines: lines.__setitem__(31, "Everything improved."),
+], ids=["unchanged", "delete-middle", "insert-middle", "edit-middle"])
+def test_streaming_revision_keeps_stored_paragraphs(anonymiser, serve_pages, edit):
+    lines = _letter()
+    serve_pages(lines)
+    previous = _stored(pipeline.analyse_document("letter.pdf", "doc"))
+
+    edit(lines)
+    serve_pages(lines)
+    full = pipeline.analyse_document("letter.pdf", "doc")
+    streamed = list(pipeline.iter_document_analysis("letter.pdf", "doc", previous=previous))[-1]['result']
+
+    for key in ('medications', 'mental_status', 'patient_pseudonym'):
+        assert streamed[key] == full[key]
+    # Unchanged paragraphs keep their stored rows and only edits are written back
+    stored_hashes = {record['id']: record['content_hash'] for record in previous['paragraphs']}
+    kept = [record for record in streamed['paragraphs'] if 'id' in record]
+    assert all(stored_hashes[record['id']] == record['content_hash'] for record in kept)
+    assert len({record['id'] for record in kept}) == len(kept) >= len(lines) - 2
+    assert sum(record['modified'] for record in streamed['paragraphs']) <= 3
+
+
+def test_streaming_revision_counts_reanalysed_paragraphs(anonymiser, serve_pages):
+    lines = _letter() * 4
+    serve_pages(lines, page_size=40)
+    previous = _stored(pipeline.analyse_document("letter.pdf", "doc"))
+
+    lines[31] = "Everything improved."
+    serve_pages(lines, page_size=40)
+    revised = pipeline.analyse_document("letter.pdf", "doc", previous=previous)
+    streamed = list(pipeline.iter_document_analysis("letter.pdf", "doc", previous=previous))[-1]['result']
+
+    # Paragraphs at page breaks are also re-extracted once the next page is read
+    assert revised['paragraphs_reanalysed'] <= streamed['paragraphs_reanalysed'] < len(lines) // 2
+
+
+def test_streaming_revision_diffs_pages_against_nearby_stored_paragraphs(anonymiser, serve_pages,
+                                                                        monkeypatch):
+    lines = _letter() * 4
+    serve_pages(lines, page_size=10)
+    previous = _stored(pipeline.analyse_document("letter.pdf", "doc"))
+
+    del lines[40:100]
+    serve_pages(lines, page_size=10)
+    revised = pipeline.analyse_document("letter.pdf", "doc", previous=previous)
+    offered = []
+
+    def analyse(text, anonymiser, nlp, patient_id, previous=None, **kwargs):
+        offered.append(len(previous))
+        return analyse_paragraphs(text, anonymiser, nlp, patient_id, previous, **kwargs)
+
+    monkeypatch.setattr(pipeline, 'analyse_paragraphs', analyse)
+    streamed = list(pipeline.iter_document_analysis("letter.pdf", "doc", previous=previous))[-1]['result']
+
+    for key in ('medications', 'mental_status'):
+        assert streamed[key] == revised[key]
+    # Pages after the deleted ones are still matched to their stored rows
+    assert all('id' in record for record in streamed['paragraphs'])
+    assert streamed['paragraphs_reanalysed'] == revised['paragraphs_reanalysed']
+    assert max(offered[:-1]) < len(previous['paragraphs']) // 4
@@ -0,0 +1,116 @@
+"""
+Tests for the API's handling of stored uploads
+"""
+import pickle
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.config import settings
+from backend.document_processor import DocumentProcessingError, DocumentProcessor
+from backend.main import _find_upload, app
+
+
+@pytest.fixture
+def upload_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'upload_dir', str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.parametrize("document_id", ["*", "doc_*", "doc_1?", "../doc_1", "doc_[0-9]"])
+def test_find_upload_rejects_patterns(upload_dir, document_id):
+    (upload_dir / "doc_1.png").write_bytes(b"scan")
+
+    assert _find_upload(document_id) is None
+
+
+def test_find_upload_finds_document(upload_dir):
+    (upload_dir / "doc_1.5.png").write_bytes(b"scan")
+
+    assert _find_upload("doc_1.5") == upload_dir / "doc_1.5.png"
+    assert _find_upload("doc_2") is None
+
+
+@pytest.fixture
+def stub_analysis(monkeypatch, upload_dir):
+    """Stub out analysis and storage; the returned setter takes what run_cpu returns or raises"""
+    monkeypatch.setattr(main, 'load_previous_analysis', lambda document_id: None)
+    monkeypatch.setattr(main, 'store_analysis', lambda result: None)
+
+    def stub(analysis):
+        async def run_cpu(func, *args, **kwargs):
+            if isinstance(analysis, Exception):
+                raise analysis
+            return analysis
+
+        monkeypatch.setattr(main.executor, 'run_cpu', run_cpu)
+    return stub
+
+
+@pytest.fixture
+def revise(stub_analysis):
+    """Post a revision with analysis stubbed out"""
+    def post(document_id, filename, content, analysis):
+        stub_analysis(analysis)
+        return TestClient(app).post(
+            f"/api/documents/{document_id}/revise", files={'file': (filename, content)}
+        )
+    return post
+
+
+def test_failed_revision_keeps_stored_version(upload_dir, revise):
+    (upload_dir / "doc_1.png").write_bytes(b"scan")
+
+    response = revise("doc_1", "letter.docx", b"corrupt",
+                      DocumentProcessingError("Error processing DOC/DOCX: not a zip file"))
+
+    assert response.status_code == 422
+    assert [path.name for path in upload_dir.iterdir()] == ["doc_1.png"]
+    assert (upload_dir / "doc_1.png").read_bytes() == b"scan"
+
+
+def test_revision_replaces_stored_version(upload_dir, revise):
+    (upload_dir / "doc_1.png").write_bytes(b"scan")
+    result = {'patient_pseudonym': 'PATIENT_1', 'medications': [], 'missing_data': [],
+              'mental_status': []}
+
+    response = revise("doc_1", "letter.docx", b"revised", result)
+
+    assert response.status_code == 200
+    assert [path.name for path in upload_dir.iterdir()] == ["doc_1.docx"]
+    assert (upload_dir / "doc_1.docx").read_bytes() == b"revised"
+
+
+def test_revision_of_pattern_id_is_rejected(upload_dir, revise):
+    (upload_dir / "doc_1.png").write_bytes(b"scan")
+
+    response = revise("*", "letter.docx", b"revised", {})
+
+    assert response.status_code == 404
+    assert [path.name for path in upload_dir.iterdir()] == ["doc_1.png"]
+
+
+@pytest.mark.parametrize("error", [
+    DocumentProcessingError("Error processing PDF: EOF marker not found"),
+    ValueError("Unsupported file format: txt"),
+])
+def test_unreadable_document_is_rejected(upload_dir, stub_analysis, error):
+    (upload_dir / "doc_1.pdf").write_bytes(b"corrupt")
+    stub_analysis(error)
+
+    response = TestClient(app).post("/api/documents/analyze", params={'document_id': "doc_1"})
+
+    assert response.status_code == 422
+    assert str(error) in response.json()['detail']
+
+
+def test_processor_reports_corrupt_document(tmp_path):
+    path = tmp_path / "letter.docx"
+    path.write_bytes(b"corrupt")
+
+    with pytest.raises(DocumentProcessingError) as raised:
+        DocumentProcessor().process_document(str(path))
+
+    # Errors are raised in worker processes and must survive pickling
+    assert isinstance(pickle.loads(pickle.dumps(raised.value)), DocumentProcessingError)
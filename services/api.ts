@@ -21,6 +21,14 @@ export interface DocumentAnalysisResult {
   mental_status_summary?: string;
   anonymised: boolean;
   processed_at: string;
+  paragraphs_total?: number;
+  paragraphs_reanalysed?: number;
+}
+
+export interface MedicationPage {
+  patient_id: string;
+  medications: MedicationRecord[];
+  next_cursor?: number | null;
 }
 
 export interface UploadResponse {
@@ -30,6 +38,12 @@ export interface UploadResponse {
   document_id: string;
 }
 
+export type AnalysisEvent =
+  | { event: 'page'; page: number; total_pages: number }
+  | { event: 'medications'; page: number; medications: MedicationRecord[] }
+  | { event: 'result'; result: DocumentAnalysisResult }
+  | { event: 'error'; status_code: number; detail: string };
+
 export interface ComplianceStatus {
   gdpr_compliant: boolean;
   nhs_standard: string;
@@ -117,15 +131,93 @@ class APIService {
   }
 
   /**
-   * Get medication history for a patient
+   * Upload a revised version of a document; only changed paragraphs are re-analyzed
+   */
+  async reviseDocument(
+    documentId: string,
+    file: { uri: string; type: string; name: string }
+  ): Promise<DocumentAnalysisResult> {
+    try {
+      const formData = new FormData();
+      formData.append('file', {
+        uri: file.uri,
+        type: file.type,
+        name: file.name,
+      } as any);
+
+      const response = await fetch(
+        `${this.baseURL}/api/documents/${encodeURIComponent(documentId)}/revise`,
+        {
+          method: 'POST',
+          body: formData,
+          headers: {
+            'Content-Type': 'multipart/form-data',
+          },
+        }
+      );
+
+      if (!response.ok) {
+        throw new Error(`Revision failed: ${response.statusText}`);
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error('Document revision failed:', error);
+      throw error;
+    }
+  }
+
+  /**
+   * Analyze a document and receive progress events as pages are processed.
+   * Returns a function that closes the stream.
    */
-  async getMedications(patientId: string): Promise<{
-    patient_id: string;
-    medications: MedicationRecord[];
-  }> {
+  streamAnalysis(
+    documentId: string,
+    onEvent: (event: AnalysisEvent) => void,
+    onError?: (error: Event) => void
+  ): () => void {
+    const wsURL = this.baseURL.replace(/^http/, 'ws');
+    const socket = new WebSocket(
+      `${wsURL}/ws/documents/${encodeURIComponent(documentId)}`
+    );
+
+    socket.onmessage = (message) => {
+      const event: AnalysisEvent = JSON.parse(message.data);
+      onEvent(event);
+      if (event.event === 'result' || event.event === 'error') {
+        socket.close();
+      }
+    };
+
+    socket.onerror = (error) => {
+      console.error('Analysis stream failed:', error);
+      onError?.(error);
+    };
+
+    return () => socket.close();
+  }
+
+  /**
+   * Get one page of a patient's medication history.
+   * Pass the returned next_cursor as cursor to fetch the following page;
+   * it is null on the last page.
+   */
+  async getMedications(
+    patientId: string,
+    cursor?: number | null,
+    limit?: number
+  ): Promise<MedicationPage> {
     try {
+      const params = new URLSearchParams({ patient_id: patientId });
+      if (cursor != null) {
+        params.append('cursor', String(cursor));
+      }
+      if (limit != null) {
+        params.append('limit', String(limit));
+      }
+
       const response = await fetch(
-        `${this.baseURL}/api/medications?patient_id=${patientId}`
+        `${this.baseURL}/api/medications?${params.toString()}`
       );
 
       if (!response.ok) {